@@ -1,68 +1,241 @@
 import chess.pgn
 import random
 import io
+import queue
+import threading
+from collections import deque
+import time
 import numpy as np
-import torch
 import requests
+from tensor import board_words
 
-def get_random_games_from_player(username, num_games=100):
-    url = f"https://lichess.org/api/games/user/{username}"
-    params = {"max": num_games, "perfType": "blitz", "pgnInJson": False}
-    response = requests.get(url, params=params)
+LICHESS_API_URL = "https://lichess.org/api"
 
-    if response.status_code != 200:
-        print("Failed to fetch data: ", response.status_code)
-        print(response.text)  # Print the response content
-        return []
 
-    pgn_data = response.text
-    games = pgn_data.strip().split("\n\n\n")  # Split the PGN data into separate games
+class RateLimit:
+    """
+    Back-off shared by concurrent downloads.
 
-    # Randomly select games if more than num_games
-    if len(games) > num_games:
-        games = random.sample(games, num_games)
+    Lichess answers 429 when a client sends too many requests; every download
+    sharing this object then waits before its next request.
+    """
+
+    def __init__(self, default_wait=60.0):
+        self.default_wait = default_wait  # Lichess asks for a full minute when no Retry-After is sent
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                delay = self.resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def back_off(self, retry_after=None):
+        wait = float(retry_after) if retry_after is not None else self.default_wait
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + wait)
+
+
+def stream_games(
+    username, num_games=100, perf_type="blitz", base_url=LICHESS_API_URL, session=None,
+    rate_limit=None, max_retries=3, **params
+):
+    """
+    Yield a player's games as chess.pgn.Game objects while they are being downloaded.
+
+    The PGN export is read straight from the HTTP response, so only the game being
+    parsed is held in memory.
+
+    :param username: Lichess username
+    :param num_games: maximum number of games
+    :param perf_type: Lichess game type filter, None for all types
+    :param base_url: API root, can point to a local stand-in server
+    :param session: optional requests.Session to reuse connections
+    :param rate_limit: optional RateLimit shared with other downloads
+    :param max_retries: number of retries after a 429 response
+    :param params: extra query parameters of the export endpoint (e.g. since)
+    """
+    url = f"{base_url}/games/user/{username}"
+    params = dict(params, max=num_games, pgnInJson=False)
+    if perf_type:
+        params["perfType"] = perf_type
+    rate_limit = rate_limit or RateLimit()
+    for attempt in range(max_retries + 1):
+        rate_limit.wait()
+        with (session or requests).get(url, params=params, stream=True) as response:
+            if response.status_code == 429 and attempt < max_retries:
+                rate_limit.back_off(response.headers.get("Retry-After"))
+                continue
+            if response.status_code != 200:
+                print("Failed to fetch data: ", response.status_code)
+                print(response.text)  # Print the response content
+                response.raise_for_status()
+                return
+            response.raw.decode_content = True  # undo gzip transfer encoding
+            pgn_stream = io.TextIOWrapper(response.raw, encoding="utf-8")
+            while True:
+                game = chess.pgn.read_game(pgn_stream)
+                if game is None:
+                    break
+                yield game
+            return
+
+
+def prefetch(iterable, buffer_size=16):
+    """
+    Run an iterator on a background thread and yield its items through a bounded queue.
+
+    Lets downloading and parsing overlap with whatever consumes the items, while at
+    most buffer_size items wait in memory.
+    """
+    items = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        # Gives up once the consumer has stopped, so the thread never blocks on a full queue
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as error:
+            put((done, error))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()  # e.g. releases the HTTP response of stream_games
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def game_color(game, username):
+    """Color ("white" or "black") the player had in a game"""
+    return "white" if game.headers.get("White", "").lower() == username.lower() else "black"
 
-    annotated_games = []
-    for game in games:
-        game_lines = game.split("\n")
-        color = (
-            "white"
-            if any('[White "{}"]'.format(username) in line for line in game_lines)
-            else "black"
-        )
-        annotated_games.append((game, color))
 
-    return annotated_games
+def get_random_games_from_player(username, num_games=100, store=None):
+    """Download a player's games as a list of (PGN text, player color), from the store if given"""
+    if store is not None:
+        store.sync(username, num_games)
+        games = store.games(username, num_games)
+    else:
+        games = stream_games(username, num_games)
+    return [(str(game), game_color(game, username)) for game in games]
 
 
 def extract_all_fens_from_pgn(pgn_text):
     """Extract random FEN positions from a game's PGN where the specified player is on the move"""
-    pgn = chess.pgn.read_game(io.StringIO(pgn_text))
+    return extract_all_fens_from_game(chess.pgn.read_game(io.StringIO(pgn_text)))
+
+
+def extract_all_fens_from_game(game):
+    """Extract the FEN of every position before a move of a parsed game"""
     game_positions = []
-    board = pgn.board()
-    for move in pgn.mainline_moves():
+    board = game.board()
+    for move in game.mainline_moves():
         game_positions.append(board.fen())
         board.push(move)
     return game_positions
 
 
-def get_games(username, num_games=100):
-    """Get random positions from a user's games"""
-    games = get_random_games_from_player(username, num_games)
+def get_games(username, num_games=100, store=None):
+    """Get random positions from a user's games
+
+    With a store (game_store.GameStore) only games missing from the local cache
+    are downloaded and the games are read from disk.
+    """
     all_games = []
     colors = []
+    if store is not None:
+        store.sync(username, num_games)
+        games = store.games(username, num_games)
+    else:
+        # Games are parsed on a background thread while the download continues
+        games = prefetch(stream_games(username, num_games))
     for game in games:
-        # print(game)
-        pgn_text = game[0]
-        player_color = game[1]
-        positions = extract_all_fens_from_pgn(pgn_text)
-
-        all_games.append(positions)
-        colors.append(player_color)
-        # print(player_color, positions)
+        all_games.append(extract_all_fens_from_game(game))
+        colors.append(game_color(game, username))
     return all_games, colors
 
 
+def sample_negative_moves(board, played_move, count=4, rng=random):
+    """Random legal moves other than the one played, see sample_negative_fens"""
+    moves = list(board.legal_moves)
+    negatives = []
+    for index in rng.sample(range(len(moves)), min(count + 1, len(moves))):
+        if moves[index] != played_move:
+            negatives.append(moves[index])
+            if len(negatives) == count:
+                break
+    return negatives
+
+
+def walk_game(game, color, stack_size=5, negatives=4, rng=random):
+    """
+    Replay a game once and yield its training stacks as codec words (tensor.board_words).
+
+    Yields the same stacks as create_stacked_set_from_game on the game's FENs,
+    but straight from the replayed board: the player's last positions are kept
+    in a ring buffer, so only O(stack_size) positions are alive at a time.
+
+    :param game: chess.pgn.Game
+    :param color: color of the mimicked player ("white" or "black")
+    :param stack_size: boards per stack [candidate, current, history...]
+    :param negatives: number of negative samples per played move (0 for none)
+    :param rng: random number generator used to pick the negative samples
+    :return: iterator of (list of stack_size board_words, target 1.0 or 0.0)
+    """
+    player = color == "white"
+    board = game.board()
+    # The player's positions before their moves, newest first; the start position pads the history
+    history = deque([board_words(board)] * (stack_size - 1), maxlen=stack_size - 1)
+    moves = iter(game.mainline_moves())
+    move = next(moves, None)
+    while move is not None:
+        next_move = next(moves, None)
+        if board.turn != player or next_move is None:
+            # The original stacks only cover moves which the opponent answered
+            board.push(move)
+            move = next_move
+            continue
+
+        if board.ply() > 0:
+            history.appendleft(board_words(board))
+        negative_moves = sample_negative_moves(board, move, negatives, rng) if negatives else []
+        board.push(move)
+        yield [board_words(board)] + list(history), 1.0
+        board.pop()
+        for negative_move in negative_moves:
+            board.push(negative_move)
+            yield [board_words(board)] + list(history), 0.0
+            board.pop()
+        board.push(move)
+        move = next_move
+
+
 def generate_possible_fens_positions(fen):
     board = chess.Board(fen)
     fen_positions = []
@@ -75,13 +248,40 @@ def generate_possible_fens_positions(fen):
     return fen_positions
 
 
-def create_stacked_set_from_game(game, color, stack_size=2, add_other_legal_moves=True):
+def sample_negative_fens(board, played_fen, count=4, rng=random):
+    """
+    FENs after random legal moves other than the one played.
+
+    Move indices are sampled first and only the chosen moves are pushed, so at
+    most count + 1 positions are built however many legal moves there are.
+
+    :param board: chess.Board before the move (restored on return)
+    :param played_fen: FEN after the move actually played, never returned
+    :param count: number of negatives (fewer if there are not enough legal moves)
+    :param rng: random number generator (e.g. a seeded random.Random)
+    """
+    moves = list(board.legal_moves)
+    negatives = []
+    for index in rng.sample(range(len(moves)), min(count + 1, len(moves))):
+        board.push(moves[index])
+        fen = board.fen()
+        board.pop()
+        if fen != played_fen:
+            negatives.append(fen)
+            if len(negatives) == count:
+                break
+    return negatives
+
+
+def create_stacked_set_from_game(game, color, stack_size=2, add_other_legal_moves=True, rng=random, negatives=4):
     """
     Create a list of stacked board representations from a game's FEN strings.
 
     :param game: List of FEN strings representing the game states.
     :param color: The color of a player
     :param stack_size: The number of consecutive positions to stack.
+    :param rng: random number generator used to pick the negative samples (e.g. a seeded random.Random)
+    :param negatives: number of negative samples (other legal moves) per played move
     :return: List of tensors, each containing 'stack_size' number of board states stacked along the channel dimension.
     """
 
@@ -132,25 +332,20 @@ def create_stacked_set_from_game(game, color, stack_size=2, add_other_legal_move
             new_stacked_sets.append(stacked_set)
             target_values.append(1.0)
 
-            possible_positions = generate_possible_fens_positions(stacked_set[1])
-            short_possible_positions = random.sample(
-                possible_positions, min(4, len(possible_positions))
-            )
-            for j in range(len(short_possible_positions)):
-                # print(short_possible_positions[j], '\n', stacked_set[0], True if short_possible_positions[j] == stacked_set[0] else False)
-                if short_possible_positions[j] != stacked_set[0]:
-                    new_stacked_set = stacked_set.copy()
-                    new_stacked_set[0] = short_possible_positions[j]
-
-                    new_stacked_sets.append(new_stacked_set)
-                    target_values.append(0.0)
-                    # print(i, j, new_stacked_set)
+            for negative_fen in sample_negative_fens(
+                chess.Board(stacked_set[1]), stacked_set[0], negatives, rng
+            ):
+                new_stacked_set = stacked_set.copy()
+                new_stacked_set[0] = negative_fen
+
+                new_stacked_sets.append(new_stacked_set)
+                target_values.append(0.0)
         # print(target_values)
         return new_stacked_sets, target_values
     return stacked_sets
 
 
-def get_games_as_a_set(games, colors, previous_moves=3, add_other_legal_moves=True):
+def get_games_as_a_set(games, colors, previous_moves=3, add_other_legal_moves=True, negatives=4):
     """
     Returns list of a processed games - tensors of size 8x8x(14 times stack_size). It represents the board state (8x8).
     14 is the number of channel (2 are for pawns, 2 for rooks..., 1 for castling and 1 for en passant). The list is as follows:
@@ -158,6 +353,7 @@ def get_games_as_a_set(games, colors, previous_moves=3, add_other_legal_moves=Tr
 
     :param games: List of games. Game is list of positions in FEN notation.
     :param previous_moves: Number of moves done before current position
+    :param negatives: Number of negative samples per played move
     :return: Processed games as list of tensors.
     """
 
@@ -165,7 +361,8 @@ def get_games_as_a_set(games, colors, previous_moves=3, add_other_legal_moves=Tr
     target_set = []
     for idx, game in enumerate(games):
         stacked_game, target_value = create_stacked_set_from_game(
-            game, colors[idx], stack_size=previous_moves + 2, add_other_legal_moves=True
+            game, colors[idx], stack_size=previous_moves + 2, add_other_legal_moves=True,
+            negatives=negatives,
         )
         games_set.extend(stacked_game)
         target_set.extend(target_value)
@@ -1,7 +1,14 @@
-import copy
 import random
 import pygame
 import time
+from search import Searcher
+from zobrist import (
+    ZOBRIST_BLACK_CASTLE,
+    ZOBRIST_EN_PASSANT,
+    ZOBRIST_PIECES,
+    ZOBRIST_WHITE_CASTLE,
+    ZOBRIST_WHITE_TURN,
+)
 
 
 # Constants
@@ -16,8 +23,72 @@ LIGHT_SQUARE = (238, 238, 210)  # Light square color
 DARK_SQUARE = (118, 150, 86)  # Dark square color
 
 
+def _target_table(offsets):
+    """For every (row, col) list the squares reached by the given offsets"""
+    return [
+        [
+            [
+                (row + dr, col + dc)
+                for dr, dc in offsets
+                if 0 <= row + dr < 8 and 0 <= col + dc < 8
+            ]
+            for col in range(COLS)
+        ]
+        for row in range(ROWS)
+    ]
+
+
+def _ray_table(directions):
+    """For every (row, col) list the rays (nearest square first) in each direction"""
+    table = []
+    for row in range(ROWS):
+        table_row = []
+        for col in range(COLS):
+            rays = []
+            for dr, dc in directions:
+                ray = []
+                new_row, new_col = row + dr, col + dc
+                while 0 <= new_row < 8 and 0 <= new_col < 8:
+                    ray.append((new_row, new_col))
+                    new_row += dr
+                    new_col += dc
+                rays.append(ray)
+            table_row.append(rays)
+        table.append(table_row)
+    return table
+
+
+# Attack tables, built once at import and indexed as TABLE[row][col]
+KNIGHT_TARGETS = _target_table(
+    [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
+)
+KING_TARGETS = _target_table(
+    [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+)
+# Squares attacked by a pawn, keyed by the pawn's direction of movement
+PAWN_TARGETS = {-1: _target_table([(-1, -1), (-1, 1)]), 1: _target_table([(1, -1), (1, 1)])}
+ROOK_RAYS = _ray_table([(-1, 0), (1, 0), (0, -1), (0, 1)])
+BISHOP_RAYS = _ray_table([(-1, -1), (-1, 1), (1, -1), (1, 1)])
+
+
+def move_to_uci(move):
+    """Convert an engine move (white at the bottom) to UCI notation
+
+    :param move: move from Chess.legal_moves
+    :type move: tuple
+    :rtype: str
+    """
+    if isinstance(move[0], tuple):  # castle, described by the king move
+        move = move[0]
+    from_row, from_col, to_row, to_col = move[:4]
+    uci = f"{'abcdefgh'[from_col]}{8 - from_row}{'abcdefgh'[to_col]}{8 - to_row}"
+    if len(move) == 5:
+        uci += move[4].lower()
+    return uci
+
+
 class Chess:
-    def __init__(self, player="w") -> None:
+    def __init__(self, player="w", search_time=None) -> None:
         self.board = [
             ["r", "n", "b", "q", "k", "b", "n", "r"],
             ["p", "p", "p", "p", "p", "p", "p", "p"],
@@ -39,6 +110,11 @@ class Chess:
         self.en_passant_target = None  # (to_x, to_y)
         self.black_castle = [True, True]  # (queen_side, king_side)
         self.white_castle = [True, True]
+        self.move_stack = []  # undo records of moves made with make_move
+        self.find_kings()
+        self.hash = self.compute_hash()
+        self.transposition_table = None  # optional zobrist.TranspositionTable
+        self.search_time = search_time  # seconds per move, random moves if None
 
         self.close = False
 
@@ -54,21 +130,13 @@ class Chess:
         while running and not self.close:
             self.draw_board(win, self.board)
             pygame.display.update()
-            possible = self.all_possible_moves()
-            filtered_moves = self.filter_illegal_moves(possible)
-            filtered_moves.extend(self.generate_castle_moves())
+            filtered_moves = self.legal_moves()
             if len(filtered_moves) >= 1:
-                random_move = random.choice(filtered_moves)
-                self.en_passant_target = None
-                if isinstance(random_move[0], tuple):
-                    for move in random_move:
-                        self.move(move)
+                if self.search_time:
+                    chosen_move = Searcher(self).search(time_limit=self.search_time)[0]
                 else:
-                    if isinstance(random_move[-1], str):
-                        self.move(random_move, random_move[-1])
-                    else:
-                        self.move(random_move)
-                self.update_castle()
+                    chosen_move = random.choice(filtered_moves)
+                self.make_move(chosen_move)
             else:
                 self.close = True
             for event in pygame.event.get():
@@ -158,7 +226,6 @@ class Chess:
                 current_row += 1
                 current_col = 0
             elif letter.lower() in "rnbqkp":
-                print(current_row, current_col, letter)
                 self.board[current_row][current_col] = letter.swapcase()
                 current_col += 1
             elif letter.isdigit():
@@ -168,19 +235,23 @@ class Chess:
             if current_row >= 7 and current_col >= 8:
                 break
         side, castling, en_passant_target, _, _ = fen_string[i + 1 :].split()
-        self.player = side
+        self.player = "w"  # FEN rank 8 is row 0, so white is at the bottom
         self.white_turn = side == "w"
         self.black_castle = ["q" in castling, "k" in castling]
         self.white_castle = ["Q" in castling, "K" in castling]
+        self.en_passant_target = None
+        self.move_stack = []
+        self.find_kings()
         if en_passant_target != "-":
             col = ord(en_passant_target[0]) - ord("a")
             row = 8 - int(en_passant_target[1])
             self.en_passant_target = (col, row)
+        self.hash = self.compute_hash()
 
     def get_move(self):
         """Get move from user
 
-        :return: (row_from, col_from, row_to, col_to, figure)
+        :return: (row_from, col_from, row_to, col_to), ready for make_move
         :rtype: tuple
         """
         while True:
@@ -194,32 +265,173 @@ class Chess:
             if self.check_input(end, False):
                 row_end, col_end = int(end[0]), int(end[1])
                 break
-        return (
-            row_start,
-            col_start,
-            row_end,
-            col_end,
-            self.board[row_start][col_start],
+        return (row_start, col_start, row_end, col_end)
+
+    def make_move(self, move):
+        """Make a move in place and push its undo record on the move stack
+
+        :param move: move from all_possible_moves or generate_castle_moves
+            (castles are a pair of king and rook moves)
+        :type move: tuple
+        """
+        undo = (
+            move,
+            None,  # moved figure
+            ".",  # captured figure
+            None,  # square of the captured figure
+            self.en_passant_target,
+            self.white_castle[:],
+            self.black_castle[:],
+            self.hash,
         )
+        self.hash ^= self._state_key()
+        self.en_passant_target = None
+
+        if isinstance(move[0], tuple):  # castle
+            for from_row, from_col, to_row, to_col in move:
+                self._set_piece(to_row, to_col, self.board[from_row][from_col])
+                self._set_piece(from_row, from_col, ".")
+                self._update_castle_rights(from_row, from_col)
+        else:
+            from_row, from_col, to_row, to_col = move[:4]
+            fig = self.board[from_row][from_col]
+            captured = self.board[to_row][to_col]
+            captured_square = (to_row, to_col)
+            if fig.lower() == "p":
+                if captured == "." and from_col != to_col:  # en passant
+                    captured_square = (from_row, to_col)
+                    captured = self.board[from_row][to_col]
+                    self._set_piece(from_row, to_col, ".")
+                elif abs(from_row - to_row) == 2:
+                    self.en_passant_target = (from_col, (from_row + to_row) // 2)
+            undo = (move, fig, captured, captured_square) + undo[4:]
+
+            self._set_piece(to_row, to_col, move[4] if len(move) == 5 else fig)
+            self._set_piece(from_row, from_col, ".")
+            self._update_castle_rights(from_row, from_col)
+            self._update_castle_rights(to_row, to_col)
+
+        self.white_turn = not self.white_turn
+        self.hash ^= self._state_key()
+        self.move_stack.append(undo)
+
+    def unmake_move(self):
+        """Take back the last move made with make_move
+
+        :return: the move which was taken back
+        :rtype: tuple
+        """
+        (
+            move,
+            fig,
+            captured,
+            captured_square,
+            self.en_passant_target,
+            self.white_castle,
+            self.black_castle,
+            position_hash,
+        ) = self.move_stack.pop()
+
+        if isinstance(move[0], tuple):  # castle
+            for from_row, from_col, to_row, to_col in move:
+                self._set_piece(from_row, from_col, self.board[to_row][to_col])
+                self._set_piece(to_row, to_col, ".")
+        else:
+            from_row, from_col, to_row, to_col = move[:4]
+            self._set_piece(to_row, to_col, ".")
+            if captured != ".":
+                self._set_piece(captured_square[0], captured_square[1], captured)
+            self._set_piece(from_row, from_col, fig)
 
-    def move(self, move, upgrade=False):
-        from_row, to_row = move[0], move[2]
-        from_col, to_col = move[1], move[3]
-        fig = self.board[from_row][from_col]
-        if upgrade:
-            fig = upgrade
-        if (
-            fig.lower() == "p"
-            and self.board[to_row][to_col] == "."
-            and from_col != to_col
-        ):  # if en passant
-            self.board[from_row][to_col] = "."
-        if fig.lower() == "p" and abs(from_row - to_row) == 2:
-            self.en_passant_target = (from_col, from_row + to_row / 2)
-        self.board[to_row][to_col] = fig
-        self.board[from_row][from_col] = "."
-
-        self.white_turn = not self.white_turn  # update turn
+        self.white_turn = not self.white_turn
+        self.hash = position_hash
+        return move
+
+    def _update_castle_rights(self, row, col):
+        """Drop castling rights when a king or rook square is left or captured
+
+        :param row: row of the square touched by a move
+        :type row: int
+        :param col: column of the square touched by a move
+        :type col: int
+        """
+        if row not in (0, 7) or col not in (0, 4, 7):
+            return
+        bottom = self.white_castle if self.player == "w" else self.black_castle
+        top = self.black_castle if self.player == "w" else self.white_castle
+        rights = bottom if row == 7 else top
+        if col == 4:
+            rights[0] = rights[1] = False
+        else:
+            rights[col // 7] = False
+
+    def _set_piece(self, row, col, fig):
+        """Place a figure (or '.') on a square
+
+        Every board write made while playing goes through here, so
+        subclasses can keep extra position state in sync with the list board.
+
+        :param row: row of the square
+        :type row: int
+        :param col: column of the square
+        :type col: int
+        :param fig: figure to be placed (ex. 'q' or 'Q'), '.' to clear
+        :type fig: string
+        """
+        old = self.board[row][col]
+        if old != ".":
+            self.hash ^= ZOBRIST_PIECES[old][row * 8 + col]
+        if fig != ".":
+            self.hash ^= ZOBRIST_PIECES[fig][row * 8 + col]
+        self.board[row][col] = fig
+        if fig == "k" or fig == "K":
+            self.king_squares[fig] = (row, col)
+
+    def compute_hash(self):
+        """Compute the Zobrist hash of the position from scratch
+
+        :return: 64-bit position key (kept up to date incrementally in self.hash)
+        :rtype: int
+        """
+        key = self._state_key()
+        for row in range(ROWS):
+            for col in range(COLS):
+                fig = self.board[row][col]
+                if fig != ".":
+                    key ^= ZOBRIST_PIECES[fig][row * 8 + col]
+        return key
+
+    def _state_key(self):
+        """Zobrist key of side to move, castling rights and en passant target"""
+        key = ZOBRIST_WHITE_TURN if self.white_turn else 0
+        for side in (0, 1):
+            if self.white_castle[side]:
+                key ^= ZOBRIST_WHITE_CASTLE[side]
+            if self.black_castle[side]:
+                key ^= ZOBRIST_BLACK_CASTLE[side]
+        if self.en_passant_target:
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_target[0]]
+        return key
+
+    def repetitions(self):
+        """Count earlier occurrences of the current position in the move stack
+
+        :return: number of times the position was seen before (2 means threefold)
+        :rtype: int
+        """
+        # Undo records keep the hash from before their move, the side to move
+        # matches every second record counting back from the last one
+        return sum(
+            1 for undo in self.move_stack[-2::-2] if undo[7] == self.hash
+        )
+
+    def find_kings(self):
+        """Locate both kings on the board (afterwards tracked by _set_piece)"""
+        self.king_squares = {}
+        for row in range(ROWS):
+            for col in range(COLS):
+                if self.board[row][col] in ("k", "K"):
+                    self.king_squares[self.board[row][col]] = (row, col)
 
     def check_input(self, inp, start=True):
         """Check if provided input is valid
@@ -316,9 +528,10 @@ class Chess:
         :rtype: list
         """
         moves = []
-        direction = 1 if self.player == "w" and fig.isupper() else -1
-        start_rank = 1 if self.player == "w" and fig.isupper() else 6
-        promotion_rank = 7 if self.player == "w" and fig.isupper() else 0
+        bottom = fig.islower() == (self.player == "w")  # pawn moves up the board
+        direction = -1 if bottom else 1
+        start_rank = 6 if bottom else 1
+        promotion_rank = 0 if bottom else 7
         promotion_pieces = (
             ["Q", "R", "B", "N"] if fig.isupper() else ["q", "r", "b", "n"]
         )
@@ -603,146 +816,55 @@ class Chess:
         """
         filtered = []
         for move in moves:
-            temp = copy.deepcopy(self.board)
-            fig = temp[move[0]][move[1]]
-            temp[move[2]][move[3]] = temp[move[0]][move[1]]
-            temp[move[0]][move[1]] = "."
-            if not self.is_king_attacked(temp, fig):
+            fig = self.board[move[0]][move[1]]
+            self.make_move(move)
+            if not self.is_king_attacked(self.board, fig):
                 filtered.append(move)
+            self.unmake_move()
         return filtered
 
     def is_king_attacked(self, board, fig):
         """Check if king is being attacked
 
-        :param board: potential board state
+        :param board: potential board state (reached through make_move or
+            _set_piece, the king square is taken from king_squares)
         :type board: list
         :param fig: figure which was moved
         :type fig: string
         :return: if the king is being attacked
         :rtype: bool
         """
-        remaining_enemy_type = set()
-        for row in range(len(board)):
-            for col in range(len(board[row])):
-                if (
-                    fig.islower() != board[row][col].islower()
-                    and board[row][col] != "."
-                ):
-                    remaining_enemy_type.add(board[row][col].lower())
-                if (
-                    board[row][col].lower() == "k"
-                    and board[row][col].islower() == fig.islower()
-                ):
-                    row_king, col_king = row, col
-
-        remaining_enemy_type = list(remaining_enemy_type)
-        if "p" in remaining_enemy_type:
-            direction = 1 if self.player == "w" and fig.isupper() else -1
-            for dy in (-1, 1):
-                if 0 <= col_king + dy < 8 and 0 <= row_king + direction < 8:
-                    if (
-                        board[row_king + direction][col_king + dy].lower() == "p"
-                        and board[row_king + direction][col_king + dy].islower()
-                        != fig.islower()
-                    ):
-                        return True
-        if "r" in remaining_enemy_type:
-            directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-            for dr, dc in directions:
-                new_row, new_col = row_king + dr, col_king + dc
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = board[new_row][new_col]
-                    if target_piece != ".":
-                        if (
-                            target_piece.lower() == "q"
-                            and target_piece.islower() != fig.islower()
-                        ):
-                            return True
-                        else:
-                            break
-                    new_row += dr
-                    new_col += dc
-        if "n" in remaining_enemy_type:
-            knight_moves = [
-                (2, 1),
-                (1, 2),
-                (-1, 2),
-                (-2, 1),
-                (-2, -1),
-                (-1, -2),
-                (1, -2),
-                (2, -1),
-            ]
-            for dr, dc in knight_moves:
-                new_row, new_col = row_king + dr, col_king + dc
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = board[new_row][new_col]
-                    if (
-                        target_piece.lower() == "n"
-                        and target_piece.islower() != fig.islower()
-                    ):
+        if fig.islower():
+            row_king, col_king = self.king_squares["k"]
+            pawn, knight, bishop, rook, queen, king = "PNBRQK"
+        else:
+            row_king, col_king = self.king_squares["K"]
+            pawn, knight, bishop, rook, queen, king = "pnbrqk"
+
+        for row, col in KNIGHT_TARGETS[row_king][col_king]:
+            if board[row][col] == knight:
+                return True
+        direction = -1 if fig.islower() == (self.player == "w") else 1
+        for row, col in PAWN_TARGETS[direction][row_king][col_king]:
+            if board[row][col] == pawn:
+                return True
+        for row, col in KING_TARGETS[row_king][col_king]:
+            if board[row][col] == king:
+                return True
+        for ray in ROOK_RAYS[row_king][col_king]:
+            for row, col in ray:
+                target_piece = board[row][col]
+                if target_piece != ".":
+                    if target_piece == rook or target_piece == queen:
                         return True
-        if "b" in remaining_enemy_type:
-            directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-            for dr, dc in directions:
-                new_row, new_col = row_king + dr, col_king + dc
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = board[new_row][new_col]
-                    if target_piece != ".":
-                        if (
-                            target_piece.lower() == "b"
-                            and target_piece.islower() != fig.islower()
-                        ):
-                            return True
-                        else:
-                            break
-                    new_row += dr
-                    new_col += dc
-        if "q" in remaining_enemy_type:
-            directions = [
-                (-1, 0),
-                (1, 0),
-                (0, -1),
-                (0, 1),
-                (-1, -1),
-                (-1, 1),
-                (1, -1),
-                (1, 1),
-            ]
-            for dr, dc in directions:
-                new_row, new_col = row_king + dr, col_king + dc
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = board[new_row][new_col]
-                    if target_piece != ".":
-                        if (
-                            target_piece.lower() == "q"
-                            and target_piece.islower() != fig.islower()
-                        ):
-                            return True
-                        else:
-                            break
-                    new_row += dr
-                    new_col += dc
-        if "k" in remaining_enemy_type:
-            king_moves = [
-                (-1, 0),
-                (1, 0),
-                (0, -1),
-                (0, 1),
-                (-1, -1),
-                (-1, 1),
-                (1, -1),
-                (1, 1),
-            ]
-            for dr, dc in king_moves:
-                new_row, new_col = row_king + dr, col_king + dc
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = board[new_row][new_col]
-                    if (
-                        target_piece.islower() != fig.islower()
-                        and target_piece.lower() == "k"
-                    ):
+                    break
+        for ray in BISHOP_RAYS[row_king][col_king]:
+            for row, col in ray:
+                target_piece = board[row][col]
+                if target_piece != ".":
+                    if target_piece == bishop or target_piece == queen:
                         return True
+                    break
 
         return False
 
@@ -756,7 +878,7 @@ class Chess:
                 return moves
 
             valid_bot_left = self.check_castle(
-                [(7, 2), (7, 3)], [(7, 2), (7, 3), (7, 4)], fig
+                [(7, 1), (7, 2), (7, 3)], [(7, 2), (7, 3), (7, 4)], fig
             )
             valid_bot_right = self.check_castle(
                 [(7, 5), (7, 6)], [(7, 4), (7, 5), (7, 6)], fig
@@ -797,7 +919,7 @@ class Chess:
                 return moves
 
             valid_up_left = self.check_castle(
-                [(0, 2), (0, 3)], [(0, 2), (0, 3), (0, 4)], fig
+                [(0, 1), (0, 2), (0, 3)], [(0, 2), (0, 3), (0, 4)], fig
             )
             valid_up_right = self.check_castle(
                 [(0, 5), (0, 6)], [(0, 4), (0, 5), (0, 6)], fig
@@ -805,28 +927,28 @@ class Chess:
 
             if (
                 self.player == "w"
-                and self.white_castle[0]
+                and self.black_castle[0]
                 and valid_up_left
                 and not self.white_turn
             ):
                 moves.append(((0, 4, 0, 2), (0, 0, 0, 3)))
             if (
                 self.player == "w"
-                and self.white_castle[1]
+                and self.black_castle[1]
                 and valid_up_right
                 and not self.white_turn
             ):
                 moves.append(((0, 4, 0, 6), (0, 7, 0, 5)))
             if (
                 self.player == "b"
-                and self.black_castle[0]
+                and self.white_castle[0]
                 and valid_up_left
                 and self.white_turn
             ):
                 moves.append(((0, 4, 0, 2), (0, 0, 0, 3)))
             if (
                 self.player == "b"
-                and self.black_castle[1]
+                and self.white_castle[1]
                 and valid_up_right
                 and self.white_turn
             ):
@@ -838,59 +960,78 @@ class Chess:
         is_valid = True
         tiles_between = [self.board[i][j] for i, j in tiles_b]
         if len(set(tiles_between)) == 1 and tiles_between[0] == ".":
+            # Walk the king over the squares in place instead of copying the board
+            king_row = tiles_b[0][0]
+            self._set_piece(king_row, 4, ".")
             for row, col in tiles_to_check:
-                temp_b = copy.deepcopy(self.board)
-                temp_b[7][4] = "."
-                temp_b[row][col] = fig
-                if self.is_king_attacked(temp_b, fig):
+                self._set_piece(row, col, fig)
+                if self.is_king_attacked(self.board, fig):
                     is_valid = False
+                self._set_piece(row, col, ".")
+            self._set_piece(king_row, 4, fig)
         else:
             is_valid = False
 
         return is_valid
 
-    def update_castle(self):
-        king_bot = self.board[7][4]
-        bot_left = self.board[7][0]
-        bot_right = self.board[7][7]
+    def in_check(self):
+        """Check if the side to move is in check
 
-        king_top = self.board[0][4]
-        up_left = self.board[0][0]
-        up_right = self.board[0][7]
+        :rtype: bool
+        """
+        return self.is_king_attacked(self.board, "k" if self.white_turn else "K")
 
-        if king_bot != "k":
-            if self.player == "w":
-                self.white_castle = [False, False]
-            else:
-                self.black_castle = [False, False]
-        else:
-            if bot_left != "r":
-                if self.player == "w":
-                    self.white_castle[0] = False
-                else:
-                    self.black_castle[0] = False
-            if bot_right != "r":
-                if self.player == "w":
-                    self.white_castle[1] = False
-                else:
-                    self.black_castle[1] = False
+    def legal_moves(self):
+        """Generate all legal moves (castles included)
 
-        if king_top != "k":
-            if self.player != "w":
-                self.white_castle = [False, False]
-            else:
-                self.black_castle = [False, False]
-        else:
-            if up_left != "r":
-                if self.player != "w":
-                    self.white_castle[0] = False
-                else:
-                    self.black_castle[0] = False
-            if up_right != "r":
-                if self.player != "w":
-                    self.white_castle[1] = False
-                else:
-                    self.black_castle[1] = False
+        :return: generated moves
+        :rtype: list
+        """
+        table = self.transposition_table
+        if table is not None:
+            moves = table.probe_moves(self.hash)
+            if moves is not None:
+                return moves[:]
+        moves = self.filter_illegal_moves(self.all_possible_moves())
+        moves.extend(self.generate_castle_moves())
+        if table is not None:
+            table.store_moves(self.hash, moves[:])
+        return moves
+
+    def perft(self, depth):
+        """Count leaf nodes of the legal move tree
+
+        :param depth: number of plies to search
+        :type depth: int
+        :return: number of positions reached after depth plies
+        :rtype: int
+        """
+        if depth == 0:
+            return 1
+        moves = self.legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def divide(self, depth):
+        """Perft node counts split by the first move
+
+        :param depth: number of plies to search (including the first move)
+        :type depth: int
+        :return: {move: node count}
+        :rtype: dict
+        """
+        counts = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            counts[move] = self.perft(depth - 1)
+            self.unmake_move()
+        return counts
 
 
 if __name__ == "__main__":
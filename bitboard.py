@@ -0,0 +1,389 @@
+from app import Chess
+
+
+# Piece order of the bitboards. Lowercase figures are white in the engine.
+PIECES = "pnbrqkPNBRQK"
+PIECE_INDEX = {fig: i for i, fig in enumerate(PIECES)}
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+KNIGHT_OFFSETS = [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+
+def square(row, col):
+    """Bit index of a board square (row 0 is the top of the board)"""
+    return row * 8 + col
+
+
+def _offset_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        for dr, dc in offsets:
+            if 0 <= row + dr < 8 and 0 <= col + dc < 8:
+                mask |= 1 << square(row + dr, col + dc)
+        table.append(mask)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        mask = 0
+        row, col = row + dr, col + dc
+        while 0 <= row < 8 and 0 <= col < 8:
+            mask |= 1 << square(row, col)
+            row, col = row + dr, col + dc
+        table.append(mask)
+    return table
+
+
+def _line_tables():
+    """LINE[a][b]: whole line through squares a and b, BETWEEN[a][b]: squares
+    strictly between them (both 0 when a and b share no line)"""
+    line = [[0] * 64 for _ in range(64)]
+    between = [[0] * 64 for _ in range(64)]
+    for dr, dc in KING_OFFSETS:
+        forward, backward = _ray_table(dr, dc), _ray_table(-dr, -dc)
+        for a in range(64):
+            full = forward[a] | backward[a] | 1 << a
+            passed = 0
+            row, col = divmod(a, 8)
+            row, col = row + dr, col + dc
+            while 0 <= row < 8 and 0 <= col < 8:
+                b = square(row, col)
+                line[a][b] = full
+                between[a][b] = passed
+                passed |= 1 << b
+                row, col = row + dr, col + dc
+    return line, between
+
+
+KNIGHT_ATTACKS = _offset_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _offset_table(KING_OFFSETS)
+# Index 0: pawns moving up the board (towards row 0), index 1: moving down
+PAWN_ATTACKS = [_offset_table([(-1, -1), (-1, 1)]), _offset_table([(1, -1), (1, 1)])]
+# (ray table, ray runs towards higher bit indexes) per sliding direction
+ROOK_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in BISHOP_DIRECTIONS]
+# Attacks of sliding pieces on an empty board
+ROOK_XRAYS = [sum(table[sq] for table, _ in ROOK_RAYS) for sq in range(64)]
+BISHOP_XRAYS = [sum(table[sq] for table, _ in BISHOP_RAYS) for sq in range(64)]
+LINE, BETWEEN = _line_tables()
+
+
+def slider_attacks(sq, occupied, rays):
+    """Squares attacked from sq by a sliding piece
+
+    :param sq: bit index of the sliding piece
+    :type sq: int
+    :param occupied: occupancy mask of the board
+    :type occupied: int
+    :param rays: ROOK_RAYS or BISHOP_RAYS
+    :type rays: list
+    :return: attack mask (includes the first blocker in every direction)
+    :rtype: int
+    """
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+def iter_squares(mask):
+    """Yield bit indexes of all set bits in mask"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitboardChess(Chess):
+    """Chess engine backed by 12 piece bitboards
+
+    Keeps the list board of Chess in sync (it is still used for drawing and
+    user input), but move generation and check detection work on integer
+    masks instead of scanning the 8x8 list of strings.
+    """
+
+    def __init__(self, player="w", search_time=None) -> None:
+        super().__init__(player, search_time)
+        self.sync_bitboards()
+
+    def sync_bitboards(self):
+        """Rebuild all bitboards from the list board"""
+        self.bitboards = [0] * 12
+        for row in range(8):
+            for col in range(8):
+                fig = self.board[row][col]
+                if fig != ".":
+                    self.bitboards[PIECE_INDEX[fig]] |= 1 << square(row, col)
+
+    def occupancy(self, bitboards=None):
+        """Occupancy masks of the board
+
+        :param bitboards: 12 piece bitboards, defaults to the current position
+        :type bitboards: list, optional
+        :return: (white, black, all) masks
+        :rtype: tuple
+        """
+        bitboards = self.bitboards if bitboards is None else bitboards
+        white = (
+            bitboards[0] | bitboards[1] | bitboards[2]
+            | bitboards[3] | bitboards[4] | bitboards[5]
+        )
+        black = (
+            bitboards[6] | bitboards[7] | bitboards[8]
+            | bitboards[9] | bitboards[10] | bitboards[11]
+        )
+        return white, black, white | black
+
+    def pawns_move_up(self, offset):
+        """Check if pawns of a side move towards row 0
+
+        :param offset: 0 for white (lowercase) pieces, 6 for black
+        :type offset: int
+        :rtype: bool
+        """
+        return (offset == 0) == (self.player == "w")
+
+    def _set_piece(self, row, col, fig):
+        bit = 1 << square(row, col)
+        old = self.board[row][col]
+        if old != ".":
+            self.bitboards[PIECE_INDEX[old]] &= ~bit
+        if fig != ".":
+            self.bitboards[PIECE_INDEX[fig]] |= bit
+        super()._set_piece(row, col, fig)
+
+    def read_position_from_fen(self, fen_string):
+        super().read_position_from_fen(fen_string)
+        self.sync_bitboards()
+
+    def all_possible_moves(self):
+        """Generate all possible moves (no check condition! castles not included)
+
+        :return: generated moves
+        :rtype: list
+        """
+        moves = []
+        bitboards = self.bitboards
+        offset = 0 if self.white_turn else 6
+        white, black, occupied = self.occupancy()
+        own, enemy = (white, black) if offset == 0 else (black, white)
+        targets_mask = ~own
+
+        self._pawn_moves(moves, offset, enemy, occupied)
+        for from_sq in iter_squares(bitboards[offset + KNIGHT]):
+            self._add_moves(moves, from_sq, KNIGHT_ATTACKS[from_sq] & targets_mask)
+        for from_sq in iter_squares(bitboards[offset + BISHOP]):
+            attacks = slider_attacks(from_sq, occupied, BISHOP_RAYS)
+            self._add_moves(moves, from_sq, attacks & targets_mask)
+        for from_sq in iter_squares(bitboards[offset + ROOK]):
+            attacks = slider_attacks(from_sq, occupied, ROOK_RAYS)
+            self._add_moves(moves, from_sq, attacks & targets_mask)
+        for from_sq in iter_squares(bitboards[offset + QUEEN]):
+            attacks = slider_attacks(from_sq, occupied, ROOK_RAYS) | slider_attacks(
+                from_sq, occupied, BISHOP_RAYS
+            )
+            self._add_moves(moves, from_sq, attacks & targets_mask)
+        for from_sq in iter_squares(bitboards[offset + KING]):
+            self._add_moves(moves, from_sq, KING_ATTACKS[from_sq] & targets_mask)
+        return moves
+
+    def _add_moves(self, moves, from_sq, targets):
+        from_row, from_col = divmod(from_sq, 8)
+        for to_sq in iter_squares(targets):
+            moves.append((from_row, from_col, to_sq >> 3, to_sq & 7))
+
+    def _pawn_moves(self, moves, offset, enemy, occupied):
+        pawns = self.bitboards[offset + PAWN]
+        promotion_pieces = ["q", "r", "b", "n"] if offset == 0 else ["Q", "R", "B", "N"]
+        if self.pawns_move_up(offset):
+            step, start_row, promotion_row, attacks = -8, 6, 0, PAWN_ATTACKS[0]
+        else:
+            step, start_row, promotion_row, attacks = 8, 1, 7, PAWN_ATTACKS[1]
+
+        for from_sq in iter_squares(pawns):
+            from_row, from_col = divmod(from_sq, 8)
+            targets = attacks[from_sq] & enemy
+            one_step = from_sq + step
+            if not occupied >> one_step & 1:
+                targets |= 1 << one_step
+                two_steps = one_step + step
+                if from_row == start_row and not occupied >> two_steps & 1:
+                    targets |= 1 << two_steps
+            for to_sq in iter_squares(targets):
+                to_row, to_col = divmod(to_sq, 8)
+                if to_row == promotion_row:
+                    moves.extend(
+                        (from_row, from_col, to_row, to_col, piece)
+                        for piece in promotion_pieces
+                    )
+                else:
+                    moves.append((from_row, from_col, to_row, to_col))
+
+        if self.en_passant_target:
+            ep_col, ep_row = self.en_passant_target
+            ep_sq = square(int(ep_row), ep_col)
+            # Own pawns standing where an enemy pawn would attack the target from
+            capturers = PAWN_ATTACKS[1 if step < 0 else 0][ep_sq] & pawns
+            for from_sq in iter_squares(capturers):
+                moves.append((from_sq >> 3, from_sq & 7, ep_sq >> 3, ep_sq & 7))
+
+    def filter_illegal_moves(self, moves):
+        """Filter moves to exlude illegal ones
+
+        Pins and checks are worked out once per side; only king moves, en
+        passant and moves out of check are tried on a copy of the bitboards.
+
+        :param moves: list of moves (list of tuples)
+        :type moves: moves
+        """
+        filtered = []
+        sides = {}  # offset -> (king square, pinned pieces, in check)
+        for move in moves:
+            from_row, from_col, to_row, to_col = move[:4]
+            fig = self.board[from_row][from_col]
+            index = PIECE_INDEX[fig]
+            offset = 0 if index < 6 else 6
+            side = sides.get(offset)
+            if side is None:
+                side = sides[offset] = self._pins_and_check(offset)
+            king_sq, pinned, checked = side
+            from_sq = square(from_row, from_col)
+            if (
+                not checked
+                and index - offset != KING
+                and (index - offset != PAWN or from_col == to_col or self.board[to_row][to_col] != ".")
+            ):
+                # Only a pinned piece can expose the king, and only by leaving the pin line
+                if not pinned >> from_sq & 1 or LINE[king_sq][from_sq] >> square(to_row, to_col) & 1:
+                    filtered.append(move)
+            elif self._is_legal(move, fig):
+                filtered.append(move)
+        return filtered
+
+    def _pins_and_check(self, offset):
+        """Pin and check state of a side
+
+        :param offset: 0 for white (lowercase) pieces, 6 for black
+        :type offset: int
+        :return: (king square, mask of pinned own pieces, king in check);
+            a side without king counts as in check so every move is tried
+        :rtype: tuple
+        """
+        bitboards = self.bitboards
+        king = bitboards[offset + KING]
+        if not king:
+            return None, 0, True
+        king_sq = king.bit_length() - 1
+        enemy_offset = 6 - offset
+        white, black, occupied = self.occupancy()
+        own = white if offset == 0 else black
+        queens = bitboards[enemy_offset + QUEEN]
+        snipers = (
+            ROOK_XRAYS[king_sq] & (bitboards[enemy_offset + ROOK] | queens)
+            | BISHOP_XRAYS[king_sq] & (bitboards[enemy_offset + BISHOP] | queens)
+        )
+        pinned = 0
+        for sniper_sq in iter_squares(snipers):
+            blockers = BETWEEN[king_sq][sniper_sq] & occupied
+            if blockers & own and not blockers & (blockers - 1):
+                pinned |= blockers
+        checked = self.is_square_attacked(bitboards, king_sq, enemy_offset)
+        return king_sq, pinned, checked
+
+    def _is_legal(self, move, fig):
+        """Try a move on a copy of the bitboards and look at the own king"""
+        from_bit = 1 << square(move[0], move[1])
+        to_bit = 1 << square(move[2], move[3])
+        temp = self.bitboards[:]
+        captured = self.board[move[2]][move[3]]
+        if captured != ".":
+            temp[PIECE_INDEX[captured]] ^= to_bit
+        elif fig.lower() == "p" and move[1] != move[3]:  # en passant
+            temp[PIECE_INDEX[fig.swapcase()]] &= ~(1 << square(move[0], move[3]))
+        temp[PIECE_INDEX[fig]] ^= from_bit | to_bit
+        return not self.is_king_attacked(temp, fig)
+
+    def is_king_attacked(self, board, fig):
+        """Check if king is being attacked
+
+        :param board: potential board state as 12 piece bitboards
+        :type board: list
+        :param fig: figure which was moved
+        :type fig: string
+        :return: if the king is being attacked
+        :rtype: bool
+        """
+        offset = 0 if fig.islower() else 6
+        king = board[offset + KING]
+        if not king:
+            return False
+        king_sq = king.bit_length() - 1
+        return self.is_square_attacked(board, king_sq, 6 - offset)
+
+    def in_check(self):
+        return self.is_king_attacked(self.bitboards, "k" if self.white_turn else "K")
+
+    def is_square_attacked(self, board, sq, enemy_offset):
+        """Check if a square is attacked by the given side
+
+        :param board: 12 piece bitboards
+        :type board: list
+        :param sq: bit index of the square
+        :type sq: int
+        :param enemy_offset: 0 for white (lowercase) attackers, 6 for black
+        :type enemy_offset: int
+        :rtype: bool
+        """
+        if KNIGHT_ATTACKS[sq] & board[enemy_offset + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & board[enemy_offset + KING]:
+            return True
+        # A defending pawn on sq would attack exactly the enemy pawns hitting it
+        pawn_table = PAWN_ATTACKS[1 if self.pawns_move_up(enemy_offset) else 0]
+        if pawn_table[sq] & board[enemy_offset + PAWN]:
+            return True
+        queens = board[enemy_offset + QUEEN]
+        straight = board[enemy_offset + ROOK] | queens
+        diagonal = board[enemy_offset + BISHOP] | queens
+        if not straight and not diagonal:
+            return False
+        _, _, occupied = self.occupancy(board)
+        if straight and slider_attacks(sq, occupied, ROOK_RAYS) & straight:
+            return True
+        if diagonal and slider_attacks(sq, occupied, BISHOP_RAYS) & diagonal:
+            return True
+        return False
+
+    def check_castle(self, tiles_b, tiles_to_check, fig):
+        _, _, occupied = self.occupancy()
+        if any(occupied >> square(row, col) & 1 for row, col in tiles_b):
+            return False
+        enemy_offset = 6 if fig.islower() else 0
+        king_row = tiles_b[0][0]
+        temp = self.bitboards[:]
+        temp[PIECE_INDEX[fig]] &= ~(1 << square(king_row, 4))
+        for row, col in tiles_to_check:
+            if self.is_square_attacked(temp, square(row, col), enemy_offset):
+                return False
+        return True
+
+
+if __name__ == "__main__":
+    chess_obj = BitboardChess()
+    chess_obj.main()
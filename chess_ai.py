@@ -1,16 +1,24 @@
 import pygame
 import chess
 import os
-from stockfish import Stockfish
 import time
-from tensor import ChessTensor
+import queue
+import threading
+from collections import deque
+from tensor import InputLayout, board_words, encode_words
 import numpy as np
-from tensorflow.keras.models import load_model
+from inference import ModelRunner
+from numpy_model import NumpyChessCNN
+from providers import BlendProvider, EngineProvider, MoveProvider, SearchProvider, UCIEnginePool
 
-# Adjust the path to your Stockfish executable
-STOCKFISH_PATH = r"C:\Users\pawel\Desktop\Chess\stockfish\stockfish-windows-x86-64.exe"
+# Who picks the AI moves: "cnn", "stockfish", "blend" (model picks among engine moves) or "search"
+AI_PROVIDER = os.environ.get("CHESS_AI_PROVIDER", "cnn")
 
-stockfish = Stockfish(STOCKFISH_PATH)
+# Any UCI engine works, only started when the provider needs it
+STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH", "stockfish")
+ENGINE_POOL_SIZE = 1
+ENGINE_DEPTH = 12
+ENGINE_TIME = 0.5  # seconds per engine call
 
 # Initialize Pygame
 pygame.init()
@@ -42,12 +50,29 @@ dragging = False  # Flag to track if a piece is being dragged
 dragged_piece = None  # Store the piece being dragged
 dragged_piece_pos = (0, 0)  # Current position of the dragged piece
 selected_square = None  # The starting square of the dragged piece
-ai_fen_history = []
-# Load the pre-trained model
-chess_cnn = load_model("my_chess_model.h5")
+AI_HISTORY_SIZE = 3
+# Channel-last encodings of the last AI positions, oldest first
+ai_history_planes = deque(maxlen=AI_HISTORY_SIZE)
+MODEL_PATH = "my_chess_model.h5"
+# Weights exported with `python numpy_model.py`, lets the game run without TensorFlow
+NUMPY_MODEL_PATH = "my_chess_model.npz"
 
-# Ensure that your model is compiled after loading (you can use the same compile parameters)
-chess_cnn.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+# Load the pre-trained model (inference only, so it does not need compiling)
+if os.path.exists(NUMPY_MODEL_PATH):
+    numpy_cnn = NumpyChessCNN.load(NUMPY_MODEL_PATH)
+    chess_cnn = ModelRunner(numpy_cnn, input_shape=numpy_cnn.input_shape, name="chess_cnn (numpy)")
+else:
+    from tensorflow.keras.models import load_model
+
+    chess_cnn = ModelRunner.from_keras(load_model(MODEL_PATH, compile=False), name="chess_cnn")
+
+# Input encoding the model was trained with (70 channels: version 1, 85: version 2 with clocks)
+MODEL_LAYOUT = InputLayout.from_input_shape(chess_cnn.input_buffer.shape[1:], 2 + AI_HISTORY_SIZE)
+# Reused model input buffer (no position has more than 218 legal moves)
+model_input_buffer = np.zeros((256,) + MODEL_LAYOUT.input_shape, dtype=MODEL_LAYOUT.dtype)
+
+# Trace the model before the game starts so the first AI move does not pay for it
+chess_cnn.warm_up()
 
 
 # Load images
@@ -209,43 +234,157 @@ def draw_panel(screen, board, images, player_times, turn):
     )  # Adjust y_offset as needed
 
 
-def generate_possible_fens(board):
-    possible_fens = []
-    for move in board.legal_moves:
-        board_copy = board.copy(stack=False)
-        board_copy.push(move)
-        possible_fens.append(board_copy.fen())
-    return possible_fens
-
+def generate_possible_tensors(board, moves=None):
+    # Encode the position after every move (all legal moves by default) straight from the board,
+    # channel-last in the model's layout, shape (N, 8, 8, board planes)
+    words = []
+    for move in board.legal_moves if moves is None else moves:
+        board.push(move)
+        words.append(board_words(board))
+        board.pop()
+    return encode_words(words, MODEL_LAYOUT)
 
-def fen_to_tensor(fen):
-    chess_tensor = ChessTensor()
-    chess_tensor.parse_fen(fen)
-    return chess_tensor.get_tensor()
 
+def board_to_planes(board):
+    # Channel-last encoding of a single board in the model's layout, shape (8, 8, board planes)
+    return encode_words([board_words(board)], MODEL_LAYOUT)[0]
 
-def create_model_input(possible_fens, current_fen, ai_fen_history):
-    model_inputs = []
-    for fen in possible_fens:
-        # Convert each FEN to tensor and reshape them
-        tensor_list = [fen_to_tensor(fen), fen_to_tensor(current_fen)] + [fen_to_tensor(fen) for fen in ai_fen_history]
-        reshaped_tensors = [tensor.transpose(1, 2, 0) for tensor in tensor_list]  # Reshape each tensor
 
-        # Concatenate the reshaped tensors to get a shape of (8, 8, 70)
-        model_input = np.concatenate(reshaped_tensors, axis=2)
-        model_inputs.append(model_input)
+def create_model_input(possible_tensors, current_board, history_planes, out=None):
+    # Fill [candidate, current, history...] inputs of shape (N, 8, 8, channels) into out (reused if big enough)
+    num_moves, board_planes = len(possible_tensors), possible_tensors.shape[-1]
+    channels = board_planes * (2 + len(history_planes))
+    if out is None or len(out) < num_moves or out.shape[3] != channels:
+        out = np.empty((num_moves, 8, 8, channels), dtype=possible_tensors.dtype)
+    out = out[:num_moves]
 
-    return np.array(model_inputs)
+    # Only the candidate channels differ between moves, the context is broadcast once per turn
+    out[..., :board_planes] = possible_tensors
+    out[..., board_planes:2 * board_planes] = board_to_planes(current_board)
+    for i, planes in enumerate(history_planes, start=2):
+        out[..., board_planes * i:board_planes * (i + 1)] = planes
+    return out
 
 
 def choose_best_move(model, model_inputs):
-    predictions = model.predict(model_inputs)
+    predictions = model(model_inputs)
+    print(model.report())
     best_move_index = np.argmax(predictions)  # Choose the move with the highest score
     return best_move_index
 
+
+class CNNProvider(MoveProvider):
+    """Plays the move the mimic model scores highest"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def model_inputs(self, board, history_planes, moves):
+        # Encode the positions after the given moves
+        possible_tensors = generate_possible_tensors(board, moves)
+
+        # Prepare model inputs
+        return create_model_input(
+            possible_tensors, board, history_planes, model_input_buffer
+        )
+
+    def score_moves(self, board, history_planes, moves):
+        scores = self.model(self.model_inputs(board, history_planes, moves))
+        print(self.model.report())
+        return scores
+
+    def choose_move(self, board, history_planes, cancel=None):
+        # One batched model call, too short to be worth interrupting
+        moves = list(board.legal_moves)
+        # Use your model to choose the best move
+        best_move_index = choose_best_move(self.model, self.model_inputs(board, history_planes, moves))
+        return moves[best_move_index]
+
+
+def create_provider(name):
+    if name == "cnn":
+        return CNNProvider(chess_cnn)
+    if name == "search":
+        return SearchProvider()
+    pool = UCIEnginePool(STOCKFISH_PATH, size=ENGINE_POOL_SIZE, depth=ENGINE_DEPTH, time_limit=ENGINE_TIME)
+    if name == "stockfish":
+        return EngineProvider(pool)
+    if name == "blend":
+        return BlendProvider(CNNProvider(chess_cnn), pool)
+    raise ValueError(f"Unknown AI provider: {name}")
+
+
+ai_provider = create_provider(AI_PROVIDER)
+
+
+def compute_ai_move(board, history_planes, cancel):
+    # Runs on the AI worker thread, board and history_planes are snapshots owned by the worker
+    return ai_provider.choose_move(board, history_planes, cancel)
+
+
+class AIWorker:
+    """Computes AI moves on a background thread so the render loop never waits for them.
+
+    request() hands over a snapshot of the position, poll() returns the chosen
+    move once it is ready (or raises what the provider raised). Cancelling a
+    request sets its event, so a running search or engine call stops early
+    instead of holding the worker; results of cancelled or outdated requests
+    are dropped.
+    """
+
+    NOT_READY = object()  # poll() result while the move is being computed
+
+    def __init__(self, choose_move):
+        self.choose_move = choose_move
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.request_id = 0  # id of the only request whose result is still wanted
+        self.cancel_event = threading.Event()  # event of the current request
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, board, history_planes):
+        self.cancel()
+        self.cancel_event = threading.Event()
+        self.requests.put(
+            (self.request_id, board.copy(stack=False), list(history_planes), self.cancel_event)
+        )
+
+    def cancel(self):
+        self.request_id += 1
+        self.cancel_event.set()
+
+    def poll(self):
+        # Returns the move of the current request (None if the provider found none),
+        # or NOT_READY if it is still being computed
+        while True:
+            try:
+                request_id, move, error = self.results.get_nowait()
+            except queue.Empty:
+                return self.NOT_READY
+            if request_id == self.request_id:
+                if error is not None:
+                    raise error
+                return move
+
+    def _run(self):
+        while True:
+            request_id, board, history_planes, cancel = self.requests.get()
+            if cancel.is_set():
+                continue  # cancelled before it started
+            move, error = None, None
+            try:
+                move = self.choose_move(board, history_planes, cancel)
+            except Exception as caught:
+                # Handed to poll(), so the worker thread survives a failing provider
+                error = caught
+            if not cancel.is_set():
+                self.results.put((request_id, move, error))
+
+
 # Main function
 def main():
-    global dragging, dragged_piece, dragged_piece_pos, selected_square, ai_fen_history
+    global dragging, dragged_piece, dragged_piece_pos, selected_square
     screen = pygame.display.set_mode((TOTAL_WIDTH, TOTAL_HEIGHT))
     screen.fill(BACKGROUND)
     pygame.display.set_caption("Chess")
@@ -255,6 +394,8 @@ def main():
 
     last_move_time = 0
     move_delay = 0.5  # 1 second delay between moves
+    ai_worker = AIWorker(compute_ai_move)
+    ai_position = None  # FEN of the position the AI is thinking about
 
     player_times = (0, 0)
 
@@ -266,6 +407,8 @@ def main():
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                ai_worker.cancel()
+                ai_provider.close()  # stop the engine processes
                 pygame.quit()
                 return
 
@@ -295,28 +438,37 @@ def main():
                     if move in board.legal_moves:
                         board.push(move)
                     selected_square = None
-            if not human_turn and current_time - last_move_time > move_delay:
-                stockfish.set_fen_position(board.fen())
-                best_move = stockfish.get_best_move()
-                while len(ai_fen_history) < 3:
-                    ai_fen_history.insert(0, chess.Board().fen())
-
-                # Generate possible FENs for the next AI moves
-                possible_fens = generate_possible_fens(board)
-
-                # Prepare model inputs
-                model_inputs = create_model_input(possible_fens, board.fen(), ai_fen_history)
-                # Use your model to choose the best move
-                best_move_index = choose_best_move(chess_cnn, model_inputs)
-                best_move = list(board.legal_moves)[best_move_index]
-
-                board.push(best_move)
-                last_move_time = current_time
-
-                # Update AI-specific FEN history
-                ai_fen_history.append(board.fen())
-                if len(ai_fen_history) > 3:  # Keep only the last 3 AI FEN states
-                    ai_fen_history.pop(0)
+
+        if ai_position is not None and ai_position != board.fen():
+            # The position changed under the AI, its answer would be stale
+            ai_worker.cancel()
+            ai_position = None
+
+        if not human_turn:
+            if (
+                ai_position is None
+                and current_time - last_move_time > move_delay
+                and any(board.generate_legal_moves())
+            ):
+                while len(ai_history_planes) < AI_HISTORY_SIZE:
+                    ai_history_planes.appendleft(board_to_planes(chess.Board()))
+                ai_worker.request(board, ai_history_planes)
+                ai_position = board.fen()
+            elif ai_position is not None:
+                try:
+                    best_move = ai_worker.poll()
+                except Exception as error:
+                    print(f"AI move failed: {error!r}")
+                    best_move = None
+                if best_move is not AIWorker.NOT_READY:
+                    # Without a move the request is made again after the move delay
+                    ai_position = None
+                    last_move_time = current_time
+                    if best_move is not None:
+                        board.push(best_move)
+
+                        # Roll the AI history, the deque drops the oldest encoding
+                        ai_history_planes.append(board_to_planes(board))
 
         draw_board(screen)
         draw_pieces(screen, images, board)
@@ -0,0 +1,179 @@
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 2
+
+
+class ShardWriter:
+    """
+    Streams named arrays into memory-mappable shards on disk.
+
+    <directory>/<name>-NNNNN.bin holds at most shard_size rows of an array as
+    raw bytes, index.json the dtype and row shape of every array and the
+    number of rows of each of its shards. Only the chunk being written is held
+    in memory.
+    """
+
+    def __init__(self, directory, shard_size=1 << 16, metadata=None):
+        """
+        :param directory: output directory, created if missing
+        :param shard_size: maximum number of rows per shard
+        :param metadata: JSON-serialisable dict stored in the index
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.metadata = metadata or {}
+        self.arrays = {}
+        self.files = {}
+
+    def write(self, name, rows):
+        """Append rows (N, ...) to the array name, all chunks of an array need the same dtype and row shape"""
+        rows = np.ascontiguousarray(rows)
+        array = self.arrays.setdefault(name, {
+            "dtype": rows.dtype.str,
+            "row_shape": list(rows.shape[1:]),
+            "shards": [],
+        })
+        if rows.dtype.str != array["dtype"] or list(rows.shape[1:]) != array["row_shape"]:
+            raise ValueError(f"Rows {rows.dtype.str} {rows.shape[1:]} do not match array {name}")
+        shards = array["shards"]
+        while len(rows):
+            if name not in self.files or shards[-1]["count"] == self.shard_size:
+                self._close_shard(name)
+                shards.append({"file": f"{name}-{len(shards):05d}.bin", "count": 0})
+                self.files[name] = open(os.path.join(self.directory, shards[-1]["file"]), "wb")
+            take = self.shard_size - shards[-1]["count"]
+            self.files[name].write(rows[:take].tobytes())
+            shards[-1]["count"] += len(rows[:take])
+            rows = rows[take:]
+
+    def _close_shard(self, name):
+        file = self.files.pop(name, None)
+        if file is not None:
+            file.close()
+
+    def close(self):
+        for name in list(self.files):
+            self._close_shard(name)
+        index = {"version": FORMAT_VERSION, "metadata": self.metadata, "arrays": self.arrays}
+        path = os.path.join(self.directory, "index.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(index, file)
+        os.replace(path + ".tmp", path)  # the index only appears once every shard is complete
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ShardedArray:
+    """
+    Read-only array stored in memory-mapped shards.
+
+    Indexed along its first axis like a NumPy array (integers, slices and
+    integer arrays of any shape). Rows are only read from disk when they are
+    indexed; a slice inside one shard is a view, anything else a copy.
+    """
+
+    def __init__(self, shards, dtype, row_shape):
+        """
+        :param shards: list of arrays (count, *row_shape), e.g. np.memmap
+        """
+        self.shards = shards
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.offsets = np.cumsum([0] + [len(shard) for shard in shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self):
+        return (len(self),) + self.row_shape
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self._slice(start, max(start, stop))
+            index = np.arange(start, stop, step)
+        if np.ndim(index) == 0:
+            row = int(index) + (len(self) if index < 0 else 0)
+            if not 0 <= row < len(self):
+                raise IndexError(f"Row {index} out of range for {len(self)} rows")
+            shard = int(np.searchsorted(self.offsets, row, side="right")) - 1
+            return self.shards[shard][row - self.offsets[shard]]
+        return self._gather(np.asarray(index))
+
+    def _slice(self, start, stop):
+        parts = []
+        for shard, offset in zip(self.shards, self.offsets):
+            if offset < stop and start < offset + len(shard):
+                parts.append(shard[max(start - offset, 0):stop - offset])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty((0,) + self.row_shape, dtype=self.dtype)
+
+    def _gather(self, index):
+        rows = index.ravel().astype(np.int64)
+        rows[rows < 0] += len(self)
+        if len(rows) and (rows.min() < 0 or rows.max() >= len(self)):
+            raise IndexError(f"Row index out of range for {len(self)} rows")
+        if len(self.shards) == 1:
+            out = np.asarray(self.shards[0][rows])
+        else:
+            shards = np.searchsorted(self.offsets, rows, side="right") - 1
+            out = np.empty((len(rows),) + self.row_shape, dtype=self.dtype)
+            for shard in np.unique(shards):
+                selected = shards == shard
+                out[selected] = self.shards[shard][rows[selected] - self.offsets[shard]]
+        return out.reshape(index.shape + self.row_shape)
+
+    def batches(self, batch_size=32):
+        """
+        Yield the rows in order, at most batch_size at a time.
+
+        Batches are views into the mapped shards (nothing is copied); the last
+        batch of every shard may be shorter.
+        """
+        for shard in self.shards:
+            for start in range(0, len(shard), batch_size):
+                yield shard[start:start + batch_size]
+
+
+class ShardDataset:
+    """
+    Memory-mapped reader of a ShardWriter directory.
+
+    Shards are mapped read-only, so opening a dataset of any size costs no
+    memory; pages are loaded by the OS when batches touch them.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "index.json")) as file:
+            index = json.load(file)
+        if index["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset version {index['version']}")
+        self.metadata = index["metadata"]
+        self.arrays = {}
+        for name, array in index["arrays"].items():
+            row_shape = tuple(array["row_shape"])
+            shards = [
+                np.memmap(
+                    os.path.join(directory, shard["file"]), dtype=array["dtype"], mode="r",
+                    shape=(shard["count"],) + row_shape,
+                )
+                for shard in array["shards"]
+            ]
+            self.arrays[name] = ShardedArray(shards, array["dtype"], row_shape)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
@@ -0,0 +1,169 @@
+import calendar
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chess.pgn
+import requests
+from LichessAPI import LICHESS_API_URL, RateLimit, stream_games
+
+
+def game_id(game):
+    """Lichess id of a game, taken from its Site header"""
+    return game.headers.get("Site", "").rstrip("/").rsplit("/", 1)[-1]
+
+
+def game_timestamp(game):
+    """Start time of a game in milliseconds since the epoch (the unit of the API's since/until)"""
+    try:
+        started = time.strptime(
+            f'{game.headers["UTCDate"]} {game.headers["UTCTime"]}', "%Y.%m.%d %H:%M:%S"
+        )
+    except (KeyError, ValueError):
+        return 0
+    return calendar.timegm(started) * 1000
+
+
+class GameStore:
+    """
+    Local cache of Lichess games, one directory per player.
+
+    <root>/<player>/games.pgn holds the games (appended on every sync) and
+    <root>/<player>/index.json maps game ids to start times. A sync only asks the
+    API for games newer than the newest stored one (since), plus older games
+    when more are requested than the store holds (until). The index is saved
+    every checkpoint games, so an interrupted sync resumes where it stopped.
+    """
+
+    def __init__(
+        self, root="games_cache", perf_type="blitz", base_url=LICHESS_API_URL, session=None,
+        rate_limit=None, checkpoint=50
+    ):
+        self.root = root
+        self.perf_type = perf_type
+        self.base_url = base_url
+        self.session = session
+        self.rate_limit = rate_limit or RateLimit()
+        self.checkpoint = checkpoint
+
+    def _player_dir(self, username):
+        return os.path.join(self.root, username.lower())
+
+    def load_index(self, username):
+        path = os.path.join(self._player_dir(username), "index.json")
+        if not os.path.exists(path):
+            return {"games": {}, "last_synced": None, "complete": False}
+        with open(path) as file:
+            return json.load(file)
+
+    def _save_index(self, username, index):
+        path = os.path.join(self._player_dir(username), "index.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(index, file)
+        os.replace(path + ".tmp", path)  # never leave a half-written index behind
+
+    def sync(self, username, num_games=100):
+        """
+        Download the games missing from the store.
+
+        :param username: Lichess username
+        :param num_games: number of games the store should hold at least (if the player has them)
+        :return: number of new games
+        """
+        os.makedirs(self._player_dir(username), exist_ok=True)
+        index = self.load_index(username)
+        games = index["games"]
+        stored = len(games)
+
+        if index["last_synced"] is None:
+            self._fetch(username, index, num_games)
+        else:
+            self._fetch(username, index, None, since=index["last_synced"])
+            missing = num_games - len(games)
+            if missing > 0 and not index["complete"]:
+                fetched = self._fetch(username, index, missing, until=min(games.values()) - 1)
+                index["complete"] = fetched < missing
+
+        self._save_index(username, index)
+        return len(games) - stored
+
+    def _fetch(self, username, index, max_games, **params):
+        games = index["games"]
+        fetched = 0
+        with open(os.path.join(self._player_dir(username), "games.pgn"), "a") as file:
+            for game in stream_games(
+                username, max_games, self.perf_type, self.base_url, self.session,
+                self.rate_limit, **params
+            ):
+                fetched += 1
+                identifier = game_id(game)
+                if identifier in games:
+                    continue  # since is inclusive, the newest stored game comes again
+                file.write(str(game) + "\n\n")
+                games[identifier] = game_timestamp(game)
+                if len(games) % self.checkpoint == 0:
+                    # Games arrive newest first, so last_synced only moves once the
+                    # whole export is stored and a resumed sync still covers the gap
+                    file.flush()
+                    self._save_index(username, index)
+        if games:
+            index["last_synced"] = max(games.values())
+        if max_games is not None and fetched < max_games and "until" not in params:
+            index["complete"] = True  # the player has no more games
+        return fetched
+
+    def games(self, username, num_games=None):
+        """
+        Read stored games, newest first.
+
+        :param num_games: maximum number of games, all if None
+        :return: list of chess.pgn.Game
+        """
+        path = os.path.join(self._player_dir(username), "games.pgn")
+        if not os.path.exists(path):
+            return []
+        stored = self.load_index(username)["games"]
+        games, seen = [], set()
+        with open(path) as file:
+            while True:
+                game = chess.pgn.read_game(file)
+                if game is None:
+                    break
+                identifier = game_id(game)
+                if identifier in stored and identifier not in seen:
+                    seen.add(identifier)
+                    games.append(game)
+        games.sort(key=lambda game: stored[game_id(game)], reverse=True)
+        return games[:num_games]
+
+
+def download_players(usernames, num_games=100, store=None, workers=4):
+    """
+    Sync the games of several players concurrently.
+
+    All downloads share one requests.Session (kept-alive connections) and one
+    RateLimit, so a 429 answer pauses every worker.
+
+    :param usernames: Lichess usernames
+    :param num_games: number of games per player
+    :param store: GameStore to fill, a default one if None
+    :param workers: number of players downloaded at the same time
+    :return: dict username -> (new games, seconds)
+    """
+    store = store or GameStore()
+    if store.session is None:
+        store.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        store.session.mount("https://", adapter)
+        store.session.mount("http://", adapter)
+
+    def download(username):
+        start = time.perf_counter()
+        new_games = store.sync(username, num_games)
+        seconds = time.perf_counter() - start
+        print(f"{username}: {new_games} new games in {seconds:.1f}s ({new_games / max(seconds, 1e-9):.1f} games/s)")
+        return new_games, seconds
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(usernames, executor.map(download, usernames)))
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+
+
+def keras_forward(model):
+    """Wrap a Keras model in a traced tf.function
+
+    The function is traced once for any batch size, so repeated calls skip the
+    per-call setup of model.predict.
+    """
+    import tensorflow as tf
+
+    @tf.function(
+        input_signature=[tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+    )
+    def forward(inputs):
+        return model(inputs, training=False)
+
+    return lambda batch: forward(batch).numpy()
+
+
+class ModelRunner:
+    """Scores batches of model inputs and records the latency of every call"""
+
+    def __init__(self, forward, input_shape=(8, 8, 70), max_batch=256, name="model"):
+        """
+        :param forward: callable mapping a float32 batch to (N, 1) scores
+        :param input_shape: shape of a single model input
+        :param max_batch: initial size of the reused input buffer
+        :param name: name shown in report()
+        """
+        self.forward = forward
+        self.name = name
+        self.input_buffer = np.zeros((max_batch,) + tuple(input_shape), dtype=np.float32)
+        self.last_latency = None
+        self.total_latency = 0.0
+        self.calls = 0
+
+    @classmethod
+    def from_keras(cls, model, **kwargs):
+        return cls(keras_forward(model), input_shape=model.input_shape[1:], **kwargs)
+
+    def __call__(self, inputs):
+        """Score a batch of inputs
+
+        :param inputs: array (N,) + input_shape, bool or float
+        :return: scores, shape (N,)
+        """
+        num_inputs = len(inputs)
+        if num_inputs > len(self.input_buffer):
+            self.input_buffer = np.zeros(
+                (num_inputs,) + self.input_buffer.shape[1:], dtype=np.float32
+            )
+        batch = self.input_buffer[:num_inputs]
+        batch[...] = inputs  # cast into the preallocated float32 buffer
+
+        start = time.perf_counter()
+        scores = np.asarray(self.forward(batch)).reshape(num_inputs)
+        self.last_latency = time.perf_counter() - start
+        self.total_latency += self.last_latency
+        self.calls += 1
+        return scores
+
+    def warm_up(self, batch_sizes=(1, 35)):
+        """Run dummy batches so tracing and allocation happen before the first real call"""
+        for batch_size in batch_sizes:
+            self.forward(np.zeros((batch_size,) + self.input_buffer.shape[1:], dtype=np.float32))
+
+    def report(self):
+        if not self.calls:
+            return f"{self.name}: no calls yet"
+        return (
+            f"{self.name}: {self.last_latency * 1000:.1f} ms last call, "
+            f"{self.total_latency / self.calls * 1000:.1f} ms mean over {self.calls} calls"
+        )
@@ -2,15 +2,22 @@ import tensorflow as tf
 from tensorflow.keras.models import Model
 from sklearn.model_selection import train_test_split
 from tensorflow.keras import layers
-from LichessAPI import get_games, get_games_as_a_set
-from tensor import ChessTensor
+from LichessAPI import get_random_games_from_player
+from game_store import GameStore
+from positions import PositionTable
+from tensor import InputLayout
+from pipeline import build_position_table, make_tf_dataset
 import numpy as np
 
 
-def create_chess_cnn():
+# Encoding the model is trained on, chess_ai recognises it from the model's input shape
+INPUT_LAYOUT = InputLayout(version=2, stack_size=5)
+
+
+def create_chess_cnn(layout=INPUT_LAYOUT):
     model = tf.keras.Sequential([
         # Convolutional layers with 'same' padding
-        layers.Conv2D(32, (3, 3), activation='relu', padding='same', input_shape=(8, 8, 70)),
+        layers.Conv2D(32, (3, 3), activation='relu', padding='same', input_shape=layout.input_shape),
         layers.MaxPooling2D((2, 2)),
         layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
         layers.MaxPooling2D((2, 2)),
@@ -32,31 +39,29 @@ def create_chess_cnn():
 
 
 if __name__ == "__main__":
-    fen_games, colors = get_games("chesstacion", 100)
-    fen_positions, target = get_games_as_a_set(fen_games, colors, 3)
-
-    chess_tensor = ChessTensor()
-    processed_tensors = []
-    for position in fen_positions:
-        temp = []
-        for board in position:
-            chess_tensor.parse_fen(board)
-            tensor = chess_tensor.get_tensor().transpose(1, 2, 0)  # Reshaping here
-            temp.append(tensor)
-        concatenated = np.concatenate(temp, axis=2)  # Concatenating here
-        processed_tensors.append(concatenated)
-        # Convert each list of tensors into a single 4D tensor and stack them
-    X = np.array(processed_tensors)
-    y = np.array(target)  # Assuming 'target' is already a list of labels
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    games = get_random_games_from_player("chesstacion", 100, store=GameStore())
+
+    # Replay the games on all cores and encode every unique position once
+    positions = build_position_table(games, previous_moves=3, seed=42)
+    positions.save("positions")
+    positions = PositionTable.load("positions")  # memory-mapped, batches are assembled on the fly
+    train_indices, val_indices = train_test_split(
+        np.arange(len(positions.targets)), test_size=0.2, random_state=42
+    )
+    train_data = make_tf_dataset(
+        positions, np.sort(train_indices), batch_size=32, seed=42, layout=INPUT_LAYOUT, augment=True
+    )
+    val_data = make_tf_dataset(
+        positions, np.sort(val_indices), batch_size=32, shuffle_buffer=0, layout=INPUT_LAYOUT
+    )
 
     # Create the CNN model
-    chess_cnn = create_chess_cnn()
+    chess_cnn = create_chess_cnn(INPUT_LAYOUT)
 
     # Summary of the model
     chess_cnn.summary()
     # Train the model
-    history = chess_cnn.fit(X_train, y_train, epochs=10, batch_size=32, validation_data=(X_val, y_val))
+    history = chess_cnn.fit(train_data, epochs=10, validation_data=val_data)
     model_path = "my_chess_model.h5"  # Change the path as needed
     chess_cnn.save(model_path)
 
@@ -0,0 +1,84 @@
+import sys
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Weight arrays of the create_chess_cnn architecture, in model.get_weights() order
+WEIGHT_NAMES = [
+    "conv1_kernel", "conv1_bias",
+    "conv2_kernel", "conv2_bias",
+    "dense1_kernel", "dense1_bias",
+    "dense2_kernel", "dense2_bias",
+    "output_kernel", "output_bias",
+]
+
+
+def export_weights(model_path="my_chess_model.h5", npz_path="my_chess_model.npz"):
+    """Save the weights of a trained Keras model into a compact .npz file (needs TensorFlow once)"""
+    from tensorflow.keras.models import load_model
+
+    weights = load_model(model_path, compile=False).get_weights()
+    if len(weights) != len(WEIGHT_NAMES):
+        raise ValueError(f"Expected {len(WEIGHT_NAMES)} weight arrays, got {len(weights)}")
+    np.savez(npz_path, **{name: w.astype(np.float32) for name, w in zip(WEIGHT_NAMES, weights)})
+
+
+def conv2d_same(x, kernel, bias):
+    """Conv2D with 'same' padding via im2col, x is (N, H, W, C) and kernel (kh, kw, C, F)"""
+    kh, kw = kernel.shape[:2]
+    padded = np.pad(x, ((0, 0), (kh // 2, kh // 2), (kw // 2, kw // 2), (0, 0)))
+    windows = sliding_window_view(padded, (kh, kw), axis=(1, 2))  # (N, H, W, C, kh, kw)
+    return np.tensordot(windows, kernel, axes=([4, 5, 3], [0, 1, 2])) + bias
+
+
+def max_pool_2x2(x):
+    n, h, w, c = x.shape
+    return x[:, :h // 2 * 2, :w // 2 * 2].reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+class NumpyChessCNN:
+    """Forward pass of the create_chess_cnn model in plain NumPy
+
+    Conv2D(32) -> MaxPool -> Conv2D(64) -> MaxPool -> Flatten -> Dense(64)
+    -> Dense(32) -> Dense(1, sigmoid), computed in float32.
+    """
+
+    def __init__(self, weights):
+        """
+        :param weights: dict of WEIGHT_NAMES arrays (or an opened .npz file)
+        """
+        self.weights = {name: np.asarray(weights[name], dtype=np.float32) for name in WEIGHT_NAMES}
+
+    @property
+    def input_shape(self):
+        """Shape of a single input, the channels follow from the first kernel"""
+        return (8, 8, self.weights["conv1_kernel"].shape[2])
+
+    @classmethod
+    def load(cls, npz_path="my_chess_model.npz"):
+        with np.load(npz_path) as weights:
+            return cls(weights)
+
+    def __call__(self, inputs):
+        """Score a batch of model inputs
+
+        :param inputs: array (N,) + input_shape
+        :return: scores, shape (N, 1)
+        """
+        w = self.weights
+        x = np.asarray(inputs, dtype=np.float32)
+        x = max_pool_2x2(relu(conv2d_same(x, w["conv1_kernel"], w["conv1_bias"])))
+        x = max_pool_2x2(relu(conv2d_same(x, w["conv2_kernel"], w["conv2_bias"])))
+        x = x.reshape(len(x), -1)  # same (H, W, C) order as Keras Flatten
+        x = relu(x @ w["dense1_kernel"] + w["dense1_bias"])
+        x = relu(x @ w["dense2_kernel"] + w["dense2_bias"])
+        x = x @ w["output_kernel"] + w["output_bias"]
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+if __name__ == "__main__":
+    export_weights(*sys.argv[1:3])
@@ -0,0 +1,117 @@
+import sys
+import time
+
+import chess
+from app import Chess, move_to_uci
+from bitboard import BitboardChess
+
+
+# (name, FEN, depth) - standard perft positions and move generator edge cases
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 3),
+    (
+        "kiwipete",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        2,
+    ),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 3),
+    (
+        "castling and promotions",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        2,
+    ),
+    ("promotion captures", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1", 3),
+    ("en passant out of check", "8/8/8/2k5/2pP4/8/B7/4K3 b - d3 0 3", 3),
+    ("en passant pinned", "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1", 3),
+    (
+        "en passant and castling",
+        "r3k2r/8/8/2pP4/8/8/8/R3K2R w KQkq c6 0 2",
+        2,
+    ),
+]
+
+
+def reference_perft(board, depth):
+    """Perft computed by python-chess"""
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += reference_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def reference_divide(board, depth):
+    counts = {}
+    for move in board.legal_moves:
+        board.push(move)
+        counts[move.uci()] = reference_perft(board, depth - 1)
+        board.pop()
+    return counts
+
+
+def find_mismatch(engine, board, depth):
+    """Walk down the divide trees until the first move which disagrees
+
+    :return: list of (UCI path, engine count, python-chess count)
+    :rtype: list
+    """
+    engine_counts = {move_to_uci(m): (m, n) for m, n in engine.divide(depth).items()}
+    reference_counts = reference_divide(board, depth)
+    for uci in sorted(set(engine_counts) | set(reference_counts)):
+        move, nodes = engine_counts.get(uci, (None, None))
+        expected = reference_counts.get(uci)
+        if nodes == expected:
+            continue
+        if depth == 1 or move is None or expected is None:
+            return [(uci, nodes, expected)]
+        engine.make_move(move)
+        board.push_uci(uci)
+        path = find_mismatch(engine, board, depth - 1)
+        board.pop()
+        engine.unmake_move()
+        return [(uci, nodes, expected)] + path
+    return []
+
+
+def run_position(engine_cls, fen, depth):
+    """Run perft on one position
+
+    :return: (node count, seconds)
+    :rtype: tuple
+    """
+    engine = engine_cls()
+    engine.read_position_from_fen(fen)
+    start = time.perf_counter()
+    nodes = engine.perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def main(engines=(Chess, BitboardChess), extra_depth=0):
+    failures = 0
+    for name, fen, depth in POSITIONS:
+        depth += extra_depth
+        expected = reference_perft(chess.Board(fen), depth)
+        print(f"{name} (depth {depth}, expected {expected} nodes)")
+        for engine_cls in engines:
+            nodes, seconds = run_position(engine_cls, fen, depth)
+            status = "ok" if nodes == expected else "MISMATCH"
+            print(
+                f"  {engine_cls.__name__:<15} {nodes:>10} nodes "
+                f"{nodes / max(seconds, 1e-9):>12.0f} nps  {status}"
+            )
+            if nodes != expected:
+                failures += 1
+                engine = engine_cls()
+                engine.read_position_from_fen(fen)
+                for uci, got, want in find_mismatch(engine, chess.Board(fen), depth):
+                    print(f"    {uci}: {got} (python-chess {want})")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(extra_depth=int(sys.argv[1]) if len(sys.argv) > 1 else 0) else 0)
@@ -0,0 +1,259 @@
+import io
+import itertools
+import random
+from multiprocessing import Pool
+
+import chess.pgn
+import numpy as np
+from LichessAPI import prefetch, walk_game
+from positions import PositionTable, index_game
+from tensor import InputLayout, castling_free, encode_word_stacks, flip_colors, mirror_files
+
+
+def game_seed(seed, index):
+    """Seed of the game at index, independent of how games are sharded over workers"""
+    return seed * 1_000_003 + index
+
+
+def example_layout(previous_moves, layout=None):
+    """Layout of examples with previous_moves history boards, version 1 if None"""
+    stack_size = previous_moves + 2
+    if layout is None:
+        return InputLayout(stack_size=stack_size)
+    if layout.stack_size != stack_size:
+        raise ValueError(f"Layout for stacks of {layout.stack_size}, examples have {stack_size} boards")
+    return layout
+
+
+def encode_game(pgn_text, color, previous_moves=3, seed=0, negatives=4, layout=None):
+    """
+    Turn one game into training examples.
+
+    :param pgn_text: PGN of the game
+    :param color: color of the mimicked player ("white" or "black")
+    :param previous_moves: number of history positions in every stack
+    :param seed: seed of the negative sampling
+    :param negatives: number of negative samples per played move
+    :param layout: tensor.InputLayout of the model, version 1 if None
+    :return: (inputs (N, 8, 8, layout channels) of layout.dtype, targets (N,) float32)
+    """
+    layout = example_layout(previous_moves, layout)
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    examples = list(walk_game(game, color, layout.stack_size, negatives, random.Random(seed)))
+    if not examples:
+        return np.zeros((0,) + layout.input_shape, dtype=layout.dtype), np.zeros(0, dtype=np.float32)
+    stacks, targets = zip(*examples)
+    return encode_word_stacks(stacks, layout), np.array(targets, dtype=np.float32)
+
+
+def _encode_shard(shard):
+    games, previous_moves, negatives, seed, layout = shard
+    inputs, targets = zip(*(
+        encode_game(pgn_text, color, previous_moves, game_seed(seed, index), negatives, layout)
+        for index, (pgn_text, color) in games
+    ))
+    return np.concatenate(inputs), np.concatenate(targets)
+
+
+def _index_shard(shard):
+    games, previous_moves, negatives, seed = shard
+    return [
+        index_game(pgn_text, color, previous_moves, game_seed(seed, index), negatives)
+        for index, (pgn_text, color) in games
+    ]
+
+
+def _map_shards(worker, games, processes, shard_size, *args):
+    # Every shard goes to the worker as (games, *args)
+    def shards():
+        shard = []
+        for game in enumerate(games):
+            shard.append(game)
+            if len(shard) == shard_size:
+                yield (shard,) + args
+                shard = []
+        if shard:
+            yield (shard,) + args
+
+    if processes == 1:
+        yield from map(worker, shards())
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap(worker, shards())
+
+
+def iter_examples(
+    games, previous_moves=3, processes=None, shard_size=16, seed=0, negatives=4, layout=None
+):
+    """
+    Encode games into training examples on a process pool.
+
+    Games are split into shards of shard_size games; every shard is replayed and
+    encoded by one worker and comes back as a single chunk. Chunks are yielded in
+    the order of the games and the result does not depend on the number of
+    processes.
+
+    :param games: iterable of (PGN text, player color), e.g. from get_random_games_from_player
+    :param processes: number of worker processes, None for one per CPU, 1 to stay in this process
+    :param seed: seed of the negative sampling
+    :param negatives: number of negative samples per played move
+    :param layout: tensor.InputLayout of the model, version 1 if None
+    :return: iterator of (inputs (N, 8, 8, layout channels), targets (N,) float32) chunks
+    """
+    layout = example_layout(previous_moves, layout)
+    return _map_shards(
+        _encode_shard, games, processes, shard_size, previous_moves, negatives, seed, layout
+    )
+
+
+def build_position_table(games, previous_moves=3, processes=None, shard_size=16, seed=0, negatives=4):
+    """
+    Encode games into a PositionTable, every unique position once.
+
+    Takes the same arguments as iter_examples and yields the same examples, in
+    the same order, as position id rows instead of encoded inputs (the layout
+    is picked when batches are assembled).
+    """
+    table = PositionTable(previous_moves + 2)
+    for indexed_games in _map_shards(
+        _index_shard, games, processes, shard_size, previous_moves, negatives, seed
+    ):
+        for indexed_game in indexed_games:
+            table.add_game(*indexed_game)
+    return table
+
+
+def build_examples(
+    games, previous_moves=3, processes=None, shard_size=16, seed=0, negatives=4, layout=None
+):
+    """Encode games into one (inputs, targets) pair, see iter_examples"""
+    layout = example_layout(previous_moves, layout)
+    chunks = list(iter_examples(games, previous_moves, processes, shard_size, seed, negatives, layout))
+    if not chunks:
+        return np.zeros((0,) + layout.input_shape, dtype=layout.dtype), np.zeros(0, dtype=np.float32)
+    inputs, targets = zip(*chunks)
+    return np.concatenate(inputs), np.concatenate(targets)
+
+
+def iter_index_batches(indices, batch_size=32, shuffle_buffer=0, seed=0):
+    """
+    Split example indices into batches, shuffled through a bounded buffer.
+
+    Indices are read in blocks of shuffle_buffer; every block is shuffled
+    together with the shuffle_buffer indices kept from the previous blocks and
+    half of them are passed on. Access stays mostly sequential (friendly
+    to memory-mapped tables) while examples still move across blocks.
+
+    :param indices: int array of example numbers, e.g. the training split
+    :param shuffle_buffer: number of buffered indices, 0 to keep the order
+    :return: iterator of int64 arrays of at most batch_size indices
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if shuffle_buffer:
+        rng = np.random.default_rng(seed)
+        shuffled = []
+        buffer = indices[:0]
+        for start in range(0, len(indices), shuffle_buffer):
+            block = np.concatenate([buffer, indices[start:start + shuffle_buffer]])
+            rng.shuffle(block)
+            # Keep shuffle_buffer indices for the next block, except after the last one
+            keep = shuffle_buffer if start + shuffle_buffer < len(indices) else 0
+            shuffled.append(block[:len(block) - keep])
+            buffer = block[len(block) - keep:]
+        indices = np.concatenate(shuffled) if shuffled else indices
+    for start in range(0, len(indices), batch_size):
+        yield indices[start:start + batch_size]
+
+
+def augment_batch(inputs, layout=None, rng=None, flip_rate=0.5, mirror_rate=0.5):
+    """
+    Replace random inputs of a batch by their symmetric versions, in place.
+
+    flip_rate of the inputs are colour-flipped (tensor.flip_colors) and
+    mirror_rate of those without castling rights are mirrored left to right
+    (tensor.mirror_files), so every epoch sees other variants of the positions
+    without another replay or encode.
+
+    :param inputs: batch (B, 8, 8, channels) in the given layout
+    :param rng: numpy Generator, a fresh unseeded one if None
+    :return: inputs
+    """
+    rng = rng or np.random.default_rng()
+    flip = rng.random(len(inputs)) < flip_rate
+    if flip.any():
+        inputs[flip] = flip_colors(inputs[flip], layout)
+    mirror = (rng.random(len(inputs)) < mirror_rate) & castling_free(inputs, layout)
+    if mirror.any():
+        inputs[mirror] = mirror_files(inputs[mirror], layout)
+    return inputs
+
+
+def iter_batches(
+    table, indices=None, batch_size=32, shuffle_buffer=0, seed=0, prefetch_batches=4, layout=None,
+    augment=False
+):
+    """
+    Yield (inputs (B, 8, 8, channels), targets (B,)) batches assembled from a PositionTable.
+
+    Batches are assembled on a background thread, at most prefetch_batches ahead
+    of the consumer.
+
+    :param augment: apply augment_batch to every batch
+    """
+    if indices is None:
+        indices = np.arange(len(table.targets))
+    rng = np.random.default_rng(seed)
+
+    def assemble():
+        for batch in iter_index_batches(indices, batch_size, shuffle_buffer, seed):
+            batch = np.sort(batch)  # order within a batch does not matter, sorted reads are faster
+            inputs = table.assemble(table.examples[batch], layout)
+            if augment:
+                augment_batch(inputs, layout, rng)
+            yield inputs, np.asarray(table.targets[batch])
+
+    return prefetch(assemble(), prefetch_batches)
+
+
+def make_tf_dataset(
+    table, indices=None, batch_size=32, shuffle_buffer=1 << 16, seed=0, layout=None, augment=False
+):
+    """
+    Wrap a PositionTable in a tf.data.Dataset of (float32 inputs, targets) batches.
+
+    Only batch indices go through the Python generator; inputs are assembled in
+    parallel map calls and prefetched while the model trains. Every iteration
+    (epoch) is shuffled with a new seed.
+
+    :param layout: tensor.InputLayout of the model, version 1 if None
+    :param augment: apply augment_batch to every batch (training data only)
+    """
+    import tensorflow as tf
+
+    if indices is None:
+        indices = np.arange(len(table.targets))
+    layout = layout or InputLayout(stack_size=table.stack_size)
+    epochs = itertools.count()
+
+    def index_batches():
+        return iter_index_batches(indices, batch_size, shuffle_buffer, game_seed(seed, next(epochs)))
+
+    def assemble(batch):
+        batch = np.sort(batch)
+        inputs = table.assemble(table.examples[batch], layout)
+        if augment:
+            # Map calls run in parallel, so every batch gets its own generator
+            augment_batch(inputs, layout, np.random.default_rng(np.append(batch, seed)))
+        return inputs, np.asarray(table.targets[batch], dtype=np.float32)
+
+    def load(batch):
+        inputs, targets = tf.numpy_function(
+            assemble, [batch], (tf.as_dtype(layout.dtype), tf.float32)
+        )
+        inputs = tf.ensure_shape(tf.cast(inputs, tf.float32), (None,) + layout.input_shape)
+        return inputs, tf.ensure_shape(targets, (None,))
+
+    dataset = tf.data.Dataset.from_generator(
+        index_batches, output_signature=tf.TensorSpec((None,), tf.int64)
+    )
+    return dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,139 @@
+import io
+import random
+
+import chess.pgn
+import numpy as np
+from dataset import ShardDataset, ShardWriter
+from LichessAPI import walk_game
+from tensor import BOARD_WORDS, encode_word_stacks
+
+
+def index_game(pgn_text, color, previous_moves=3, seed=0, negatives=4):
+    """
+    Turn one game into training examples that reference its unique positions.
+
+    Positions are keyed by their codec words, so every unique position is
+    encoded once.
+
+    :return: (position keys, codec words (U, 13) uint64, examples (N, S) int32 indices
+        into the keys, targets (N,) float32)
+    """
+    stack_size = previous_moves + 2
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    ids = {}
+    examples = []
+    targets = []
+    for stack, target in walk_game(game, color, stack_size, negatives, random.Random(seed)):
+        examples.append([ids.setdefault(tuple(masks), len(ids)) for masks in stack])
+        targets.append(target)
+    keys = list(ids)
+    words = np.asarray(keys, dtype=np.uint64).reshape(len(keys), BOARD_WORDS)
+    examples = np.asarray(examples, dtype=np.int32).reshape(len(examples), stack_size)
+    return keys, words, examples, np.array(targets, dtype=np.float32)
+
+
+class PositionTable:
+    """
+    Interned, bit-packed positions and the examples that reference them.
+
+    Every unique position is stored once as codec words (104 bytes, see
+    tensor.board_words). An example is
+    a row of position ids [candidate, current, history...] and is assembled
+    into a (8, 8, layout channels) input only when a batch needs it. Saved tables are
+    dataset shards, loaded memory-mapped.
+    """
+
+    def __init__(self, stack_size=5):
+        self.stack_size = stack_size
+        self.ids = {}
+        self.num_boards = 0  # rows of boards in use (ids is empty in a loaded table)
+        self.boards = np.empty((1024, BOARD_WORDS), dtype=np.uint64)
+        self.example_chunks = []
+        self.target_chunks = []
+
+    def __len__(self):
+        return self.num_boards
+
+    def intern(self, keys, words):
+        """
+        Add positions not seen yet.
+
+        :param keys: hashable keys of the positions (index_game uses their codec words)
+        :param words: their codec words (len(keys), 13)
+        :return: global ids of the keys, int32 array
+        """
+        ids = np.empty(len(keys), dtype=np.int32)
+        new = []
+        for n, key in enumerate(keys):
+            position_id = self.ids.get(key)
+            if position_id is None:
+                position_id = self.ids[key] = self.num_boards + len(new)
+                new.append(n)
+            ids[n] = position_id
+        if new:
+            start, size = self.num_boards, self.num_boards + len(new)
+            if size > len(self.boards):
+                boards = np.empty((max(size, 2 * len(self.boards)), BOARD_WORDS), dtype=np.uint64)
+                boards[:start] = self.boards[:start]
+                self.boards = boards
+            self.boards[start:size] = words[new]
+            self.num_boards = size
+        return ids
+
+    def add_game(self, keys, words, examples, targets):
+        """Add the output of index_game"""
+        ids = self.intern(keys, words)
+        self.example_chunks.append(ids[examples])
+        self.target_chunks.append(targets)
+
+    @property
+    def examples(self):
+        """Position ids of all examples, (N, S) int32"""
+        if len(self.example_chunks) != 1:
+            chunks = self.example_chunks or [np.empty((0, self.stack_size), dtype=np.int32)]
+            self.example_chunks = [np.concatenate(chunks)]
+        return self.example_chunks[0]
+
+    @property
+    def targets(self):
+        if len(self.target_chunks) != 1:
+            self.target_chunks = [np.concatenate(self.target_chunks or [np.empty(0, dtype=np.float32)])]
+        return self.target_chunks[0]
+
+    def assemble(self, examples, layout=None):
+        """
+        Build model inputs from rows of position ids.
+
+        :param examples: int array (B, S), e.g. table.examples[batch]
+        :param layout: tensor.InputLayout of the model, version 1 if None
+        :return: array (B, 8, 8, layout channels)
+        """
+        return encode_word_stacks(self.boards[examples], layout)
+
+    def save(self, directory, shard_size=1 << 16):
+        """
+        Write the table as dataset shards (boards, examples and targets arrays).
+
+        :param shard_size: maximum number of rows per shard file
+        """
+        arrays = (
+            ("boards", self.boards, len(self)),
+            ("examples", self.examples, len(self.examples)),
+            ("targets", self.targets, len(self.targets)),
+        )
+        with ShardWriter(directory, shard_size, {"stack_size": self.stack_size}) as writer:
+            for name, array, size in arrays:
+                writer.write(name, array[:0])  # keeps dtype and shape of empty arrays
+                for start in range(0, size, shard_size):
+                    writer.write(name, array[start:min(start + shard_size, size)])
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved table, memory-mapped (no keys, so it cannot be extended)"""
+        dataset = ShardDataset(directory)
+        table = cls(dataset.metadata["stack_size"])
+        table.boards = dataset["boards"]
+        table.num_boards = len(table.boards)
+        table.example_chunks = [dataset["examples"]]
+        table.target_chunks = [dataset["targets"]]
+        return table
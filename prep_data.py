@@ -6,10 +6,10 @@ import numpy as np
 def download_games(player_id, max_games=100, filename='games.pgn'):
     url = f"https://lichess.org/api/games/user/{player_id}"
     params = {'max': max_games, 'pgnInJson': False}
-    response = requests.get(url, params=params)
-
-    with open(filename, 'w') as file:
-        file.write(response.text)
+    # Stream the export to disk instead of holding it in memory
+    with requests.get(url, params=params, stream=True) as response, open(filename, 'wb') as file:
+        for chunk in response.iter_content(chunk_size=1 << 16):
+            file.write(chunk)
 
     print(f"Games saved to {filename}")
 
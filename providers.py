@@ -0,0 +1,220 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import chess
+import chess.engine
+from app import move_to_uci
+from bitboard import BitboardChess
+from search import Searcher
+
+
+class MoveProvider:
+    """Chooses the AI move for a python-chess board"""
+
+    def choose_move(self, board, history_planes, cancel=None):
+        """
+        :param board: position to move in (a snapshot, may be modified)
+        :param history_planes: channel-last encodings of the last AI positions
+        :param cancel: optional threading.Event set when the answer is no longer
+            wanted; long computations should stop early (the result is dropped)
+        :return: chess.Move
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release engine processes and other resources, called when the game exits"""
+
+
+class UCIEnginePool:
+    """Pool of UCI engine processes with a bounded search limit
+
+    Processes are started on first use (at most size of them) and shared
+    between threads; callers wait while all of them are busy. A process that
+    dies is dropped and replaced on demand.
+    """
+
+    def __init__(self, command, size=1, depth=12, time_limit=0.5, options=None, timeout=10.0):
+        """
+        :param command: engine executable (or argument list), any UCI engine works
+        :param size: maximum number of engine processes
+        :param depth: maximum search depth per call
+        :param time_limit: maximum seconds per call
+        :param options: UCI options sent to every process, e.g. {"Threads": 1}
+        :param timeout: seconds an engine may take beyond time_limit before the
+            call fails with TimeoutError and the process is dropped
+        """
+        self.command = command
+        self.size = size
+        self.limit = chess.engine.Limit(depth=depth, time=time_limit)
+        self.options = options or {}
+        self.timeout = timeout
+        self.idle = []
+        self.started = 0
+        self.closed = False
+        # Notified whenever an engine is returned, a slot is freed or the pool is closed
+        self.changed = threading.Condition()
+
+    def _acquire(self):
+        with self.changed:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Engine pool is closed")
+                if self.idle:
+                    return self.idle.pop()
+                if self.started < self.size:
+                    self.started += 1
+                    break
+                self.changed.wait()
+        try:
+            engine = chess.engine.SimpleEngine.popen_uci(self.command, timeout=self.timeout)
+            engine.configure(self.options)
+        except BaseException:
+            self._free_slot()
+            raise
+        return engine
+
+    def _free_slot(self):
+        with self.changed:
+            self.started -= 1
+            self.changed.notify()  # a waiting caller may start a new engine
+
+    def _discard(self, engine):
+        self._free_slot()
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    def analyse(self, board, multipv=1, cancel=None):
+        """Analyse a position with a pooled engine
+
+        :param cancel: optional threading.Event, the engine is told to stop
+            searching once it is set (its partial result is returned)
+        :return: list of multipv infos, best line first
+        """
+        engine = self._acquire()
+        done = threading.Event()
+        lock = threading.Lock()
+        if cancel is not None:
+            threading.Thread(
+                target=self._stop_on_cancel, args=(engine, cancel, done, lock), daemon=True
+            ).start()
+        try:
+            infos = self._run_analysis(engine, board, multipv)
+        except BaseException:
+            # Whatever went wrong (crash, timeout, interrupt), the process may be
+            # mid-search, so it is never handed out again
+            self._discard(engine)
+            raise
+        finally:
+            with lock:
+                done.set()
+        self._release(engine)
+        return infos
+
+    def _release(self, engine):
+        with self.changed:
+            closed = self.closed
+            if not closed:
+                self.idle.append(engine)
+                self.changed.notify()
+        if closed:
+            self._discard(engine)  # the pool was closed during the call
+
+    def _run_analysis(self, engine, board, multipv):
+        # Waits with a timeout of its own: SimpleEngine.analyse cancels the analysis
+        # on timeout, after which python-chess cannot shut the process down cleanly
+        future = asyncio.run_coroutine_threadsafe(
+            engine.protocol.analyse(board, self.limit, multipv=multipv), engine.protocol.loop
+        )
+        try:
+            return future.result(self.limit.time + self.timeout)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError(f"Engine did not answer within {self.limit.time + self.timeout:g}s") from None
+
+    @staticmethod
+    def _stop_on_cancel(engine, cancel, done, lock):
+        while not done.wait(0.02):
+            if cancel.is_set():
+                with lock:
+                    if not done.is_set():
+                        # The UCI stop command makes the engine answer with its best move so far
+                        engine.protocol.loop.call_soon_threadsafe(engine.protocol.send_line, "stop")
+                return
+
+    def best_moves(self, board, count=1, cancel=None):
+        """Best moves of a position according to the engine, best first"""
+        infos = self.analyse(board, multipv=count, cancel=cancel)
+        return [info["pv"][0] for info in infos if info.get("pv")]
+
+    def close(self):
+        """
+        Stop the idle engines; engines still busy are stopped when their call
+        returns and callers waiting for an engine raise RuntimeError.
+        """
+        with self.changed:
+            self.closed = True
+            engines, self.idle = self.idle, []
+            self.changed.notify_all()
+        for engine in engines:
+            self._discard(engine)
+
+
+class EngineProvider(MoveProvider):
+    """Plays the best move of an external UCI engine"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def choose_move(self, board, history_planes, cancel=None):
+        moves = self.pool.best_moves(board, cancel=cancel)
+        return moves[0] if moves else None  # no line when cancelled right away
+
+    def close(self):
+        self.pool.close()
+
+
+class SearchProvider(MoveProvider):
+    """Plays the move of the native alpha-beta search (no external engine needed)"""
+
+    def __init__(self, time_limit=1.0, max_depth=64):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+
+    def choose_move(self, board, history_planes, cancel=None):
+        engine = BitboardChess()
+        engine.read_position_from_fen(board.fen())
+        move = Searcher(engine).search(self.max_depth, self.time_limit, cancel)[0]
+        return chess.Move.from_uci(move_to_uci(move))
+
+
+class BlendProvider(MoveProvider):
+    """Lets the model pick among the engine's best candidate moves
+
+    Keeps the style of the mimic model while the engine rules out blunders.
+    """
+
+    def __init__(self, model_provider, pool, candidates=5):
+        """
+        :param model_provider: provider with score_moves(board, history_planes, moves)
+        :param pool: UCIEnginePool used to find the candidate moves
+        :param candidates: number of engine moves (multipv lines) offered to the model
+        """
+        self.model_provider = model_provider
+        self.pool = pool
+        self.candidates = candidates
+
+    def choose_move(self, board, history_planes, cancel=None):
+        moves = self.pool.best_moves(board, self.candidates, cancel)
+        if cancel is not None and cancel.is_set():
+            return None
+        if not moves:
+            moves = list(board.legal_moves)  # no engine line, the model picks on its own
+        if len(moves) <= 1:
+            return moves[0] if moves else None
+        scores = self.model_provider.score_moves(board, history_planes, moves)
+        return moves[int(scores.argmax())]
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,251 @@
+import time
+
+from zobrist import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+
+
+MATE = 100000
+INFINITY = 10 * MATE
+MAX_PLY = 128
+
+# Lowercase figures are white in the engine
+PIECE_VALUES = {
+    "p": 100, "n": 320, "b": 330, "r": 500, "q": 900, "k": 0,
+    "P": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0,
+}
+# Bonus for knights and bishops close to the middle of the board
+CENTER_BONUS = [
+    [min(row, 7 - row, col, 7 - col) * 8 for col in range(8)] for row in range(8)
+]
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(engine):
+    """Static evaluation of a position
+
+    :param engine: Chess (or BitboardChess) instance
+    :type engine: Chess
+    :return: score in centipawns from the side to move's point of view
+    :rtype: int
+    """
+    score = 0
+    white_moves_up = engine.player == "w"
+    for row, board_row in enumerate(engine.board):
+        for col, fig in enumerate(board_row):
+            if fig == ".":
+                continue
+            value = PIECE_VALUES[fig]
+            lower = fig.islower()
+            if fig in "nbNB":
+                value += CENTER_BONUS[row][col]
+            elif fig in "pP":
+                # Reward pawns for every row they advanced
+                value += 5 * ((6 - row) if lower == white_moves_up else (row - 1))
+            score += value if lower else -value
+    return score if engine.white_turn else -score
+
+
+class Searcher:
+    """Negamax alpha-beta search over the Chess move generator
+
+    Iterative deepening with a transposition table, MVV-LVA capture ordering,
+    killer moves, quiescence search on captures and a time budget per move.
+    """
+
+    def __init__(self, engine, table_size=1 << 16) -> None:
+        """
+        :param engine: position to search, modified in place and restored
+        :type engine: Chess
+        :param table_size: transposition table slots, used if the engine has
+            no table attached yet (the new table is attached to the engine)
+        :type table_size: int
+        """
+        self.engine = engine
+        if engine.transposition_table is None:
+            engine.transposition_table = TranspositionTable(table_size)
+        self.table = engine.transposition_table
+        self.nodes = 0
+        self.deadline = None
+        self.cancel = None
+
+    def search(self, max_depth=MAX_PLY - 1, time_limit=1.0, cancel=None):
+        """Find the best move for the side to move
+
+        :param max_depth: deepest iteration to search
+        :type max_depth: int
+        :param time_limit: seconds for the whole search
+        :type time_limit: float
+        :param cancel: optional threading.Event, the search stops soon after it is set
+        :type cancel: threading.Event
+        :return: (best move, score, principal variation), best move is None
+            if there are no legal moves
+        :rtype: tuple
+        """
+        engine = self.engine
+        moves = engine.legal_moves()
+        if not moves:
+            return None, -MATE if engine.in_check() else 0, []
+
+        self.deadline = time.perf_counter() + time_limit
+        self.cancel = cancel
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.table.new_search()
+        stack_size = len(engine.move_stack)
+
+        best = (self._order(moves, 0, None)[0], 0, [])
+        for depth in range(1, min(max_depth, MAX_PLY - 1) + 1):
+            try:
+                score = self._negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                # Take back the moves of the interrupted iteration
+                while len(engine.move_stack) > stack_size:
+                    engine.unmake_move()
+                break
+            best = (self.pv[0][0], score, self.pv[0][:])
+            if abs(score) >= MATE - MAX_PLY:
+                break
+        return best
+
+    def _check_time(self):
+        self.nodes += 1
+        if not self.nodes & 255 and (
+            time.perf_counter() > self.deadline or self.cancel is not None and self.cancel.is_set()
+        ):
+            raise SearchTimeout()
+
+    def _negamax(self, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        self._check_time()
+        engine = self.engine
+        if ply and engine.repetitions():
+            return 0
+        if ply >= MAX_PLY - 1:
+            return evaluate(engine)
+
+        entry = self.table.probe(engine.hash)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry[5]
+            if ply and entry[3] is not None and entry[2] >= depth:
+                score = _score_from_table(entry[3], ply)
+                if (
+                    entry[4] == EXACT
+                    or (entry[4] == LOWER_BOUND and score >= beta)
+                    or (entry[4] == UPPER_BOUND and score <= alpha)
+                ):
+                    return score
+
+        if depth <= 0:
+            return self._quiescence(alpha, beta, ply)
+
+        moves = engine.legal_moves()
+        if not moves:
+            return -MATE + ply if engine.in_check() else 0
+
+        alpha_start = alpha
+        best_score, best_move = -INFINITY, None
+        for move in self._order(moves, ply, tt_move):
+            engine.make_move(move)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            engine.unmake_move()
+
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+            if alpha >= beta:
+                if not self._capture_value(move):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1], killers[0] = killers[0], move
+                break
+
+        if best_score <= alpha_start:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(
+            engine.hash, depth, _score_to_table(best_score, ply), flag, best_move
+        )
+        return best_score
+
+    def _quiescence(self, alpha, beta, ply):
+        """Search captures only, until the position is quiet"""
+        self.pv[ply] = []
+        self._check_time()
+        engine = self.engine
+        stand_pat = evaluate(engine)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        captures = engine.filter_illegal_moves(
+            [move for move in engine.all_possible_moves() if self._capture_value(move)]
+        )
+        for move in self._order(captures, ply, None):
+            engine.make_move(move)
+            score = -self._quiescence(-beta, -alpha, ply + 1)
+            engine.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _capture_value(self, move):
+        """MVV-LVA score of a capture or promotion, 0 for quiet moves"""
+        if isinstance(move[0], tuple):  # castle
+            return 0
+        board = self.engine.board
+        attacker = board[move[0]][move[1]]
+        victim = board[move[2]][move[3]]
+        if victim == "." and attacker in "pP" and move[1] != move[3]:
+            victim = "p"  # en passant
+        value = 0
+        if victim != ".":
+            value = 10 * PIECE_VALUES[victim] - PIECE_VALUES[attacker] + 1000
+        if len(move) == 5:
+            value += PIECE_VALUES[move[4]]
+        return value
+
+    def _order(self, moves, ply, tt_move):
+        """Sort moves: table move, captures by MVV-LVA, killers, quiet moves"""
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+
+        def key(move):
+            if move == tt_move:
+                return INFINITY
+            value = self._capture_value(move)
+            if value:
+                return value
+            if move == killers[0]:
+                return 2
+            if move == killers[1]:
+                return 1
+            return 0
+
+        return sorted(moves, key=key, reverse=True)
+
+
+def _score_to_table(score, ply):
+    """Make mate scores relative to the stored position"""
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
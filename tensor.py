@@ -1,6 +1,351 @@
 import numpy as np
 import chess
 
+PIECE_ORDER = 'PRNBQKprnbqk'
+
+# Plane of every piece character by its ASCII code, -1 for empty squares
+PLANE_LOOKUP = np.full(256, -1, dtype=np.int8)
+for _index, _piece in enumerate(PIECE_ORDER):
+    PLANE_LOOKUP[ord(_piece)] = _index
+
+# Expands the FEN board field to 64 characters, one per square
+_EXPAND_BOARD = {ord(str(n)): '.' * n for n in range(1, 9)}
+_EXPAND_BOARD[ord('/')] = None
+
+_SQUARE_ROWS = 7 - np.arange(64) // 8  # FEN lists rank 8 first
+_SQUARE_COLS = np.arange(64) % 8
+
+
+def encode_fens(fens, out=None):
+    """ Encode FEN strings into one (N, 14, 8, 8) bool array.
+
+    :param fens: list or iterator of FEN strings
+    :param out: optional preallocated bool array with at least N rows
+    :return: array (a view of out if given) with the ChessTensor planes of every FEN
+    """
+    fens = list(fens)
+    if out is None:
+        out = np.zeros((len(fens), 14, 8, 8), dtype=bool)
+    else:
+        out = out[:len(fens)]
+        out.fill(0)
+    if not fens:
+        return out
+
+    boards = []
+    for n, fen in enumerate(fens):
+        board, turn, castling, en_passant, _, _ = fen.split(" ")
+        boards.append(board.translate(_EXPAND_BOARD))
+
+        # Castling rights layer
+        if 'K' in castling: out[n, 12, 7, 7] = True  # White king-side
+        if 'Q' in castling: out[n, 12, 7, 0] = True  # White queen-side
+        if 'k' in castling: out[n, 12, 0, 7] = True  # Black king-side
+        if 'q' in castling: out[n, 12, 0, 0] = True  # Black queen-side
+
+        # En passant layer
+        if en_passant != "-":
+            out[n, 13, 8 - int(en_passant[1]), ord(en_passant[0]) - ord('a')] = True
+
+    # Piece layers of all boards at once
+    codes = np.frombuffer("".join(boards).encode("ascii"), dtype=np.uint8)
+    planes = PLANE_LOOKUP[codes].reshape(len(fens), 64)
+    positions, squares = np.nonzero(planes >= 0)
+    out[positions, planes[positions, squares], _SQUARE_ROWS[squares], _SQUARE_COLS[squares]] = True
+    return out
+
+
+_CASTLING_CORNERS = chess.BB_A1 | chess.BB_H1 | chess.BB_A8 | chess.BB_H8
+
+
+def board_masks(board):
+    """ Returns the 14 planes of a chess.Board as 64-bit masks.
+
+    Bit (rank * 8 + file) of a mask is plane[rank][file], so piece masks are the
+    board's own bitboards. The castling and en passant planes are stored upside
+    down (rank 8 first) like in parse_fen, so their masks are flipped.
+    """
+    white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+    pawns, rooks, knights = board.pawns, board.rooks, board.knights
+    bishops, queens, kings = board.bishops, board.queens, board.kings
+    masks = [
+        pawns & white, rooks & white, knights & white, bishops & white, queens & white, kings & white,
+        pawns & black, rooks & black, knights & black, bishops & black, queens & black, kings & black,
+    ]
+    masks.append(chess.flip_vertical(board.clean_castling_rights() & _CASTLING_CORNERS))
+    # board.fen() only lists the en passant square if the capture is legal
+    if board.ep_square is not None and board.has_legal_en_passant():
+        masks.append(chess.flip_vertical(chess.BB_SQUARES[board.ep_square]))
+    else:
+        masks.append(0)
+    return masks
+
+
+def encode_masks(masks, out=None):
+    """ Unpack plane masks (see board_masks) into a (N, 14, 8, 8) bool array. """
+    masks = np.asarray(masks, dtype='<u8').reshape(-1, 14)
+    bits = np.unpackbits(masks.view(np.uint8), bitorder='little').view(bool)
+    planes = bits.reshape(len(masks), 14, 8, 8)
+    if out is None:
+        return planes
+    out[:len(masks)] = planes
+    return out[:len(masks)]
+
+
+def encode_boards(boards, out=None):
+    """ Encode chess.Board objects into one (N, 14, 8, 8) bool array without FEN round-trips. """
+    return encode_masks([board_masks(board) for board in boards], out)
+
+
+def encode_stacks(stacks):
+    """ Encode stacks of FENs into model inputs.
+
+    :param stacks: list of equally long FEN lists, e.g. [candidate, current, history...]
+    :return: bool array (N, 8, 8, 14 * stack size), boards concatenated along the channels
+    """
+    stacks = list(stacks)
+    stack_size = len(stacks[0]) if stacks else 0
+    planes = encode_fens(fen for stack in stacks for fen in stack)
+    planes = planes.reshape(len(stacks), stack_size, 14, 8, 8)
+    return planes.transpose(0, 3, 4, 1, 2).reshape(len(stacks), 8, 8, 14 * stack_size)
+
+
+# Compact codec: 12 piece bitboards (PIECE_ORDER, bit rank * 8 + file) and a state word
+BOARD_WORDS = 13
+STATE_CASTLING = (1, 2, 4, 8)  # K, Q, k, q
+STATE_WHITE_TO_MOVE = 1 << 4
+STATE_EN_PASSANT = 1 << 5  # en passant square (rank * 8 + file) in bits 8-13
+_EP_SHIFT = 8
+# Move clocks, capped to their field width
+_HALFMOVE_SHIFT, _HALFMOVE_MAX = 16, 255
+_FULLMOVE_SHIFT, _FULLMOVE_MAX = 24, 65535
+
+# Castling plane bit (rank 8 first, see board_masks) of every STATE_CASTLING flag
+_CASTLING_PLANE_BITS = (63, 56, 7, 0)
+
+
+def board_words(board):
+    """ Returns a chess.Board as BOARD_WORDS 64-bit integers (12 piece bitboards and the state word). """
+    words = board_masks(board)
+    en_passant, castling = words.pop(), words.pop()
+    state = STATE_WHITE_TO_MOVE if board.turn else 0
+    for flag, bit in zip(STATE_CASTLING, _CASTLING_PLANE_BITS):
+        if castling >> bit & 1:
+            state |= flag
+    if en_passant:
+        state |= STATE_EN_PASSANT | ((en_passant.bit_length() - 1) ^ 56) << _EP_SHIFT
+    state |= min(board.halfmove_clock, _HALFMOVE_MAX) << _HALFMOVE_SHIFT
+    state |= min(board.fullmove_number, _FULLMOVE_MAX) << _FULLMOVE_SHIFT
+    words.append(state)
+    return words
+
+
+def words_to_masks(words):
+    """ Convert (N, 13) codec words into (N, 14) plane masks (see board_masks), vectorised. """
+    words = np.asarray(words, dtype=np.uint64).reshape(-1, BOARD_WORDS)
+    masks = np.empty((len(words), 14), dtype=np.uint64)
+    masks[:, :12] = words[:, :12]
+    state = words[:, 12]
+    castling = np.zeros(len(words), dtype=np.uint64)
+    for flag, bit in zip(STATE_CASTLING, _CASTLING_PLANE_BITS):
+        castling |= np.where(state & np.uint64(flag), np.uint64(1 << bit), np.uint64(0))
+    masks[:, 12] = castling
+    ep_square = (state >> np.uint64(_EP_SHIFT) & np.uint64(63)) ^ np.uint64(56)
+    masks[:, 13] = np.where(
+        state & np.uint64(STATE_EN_PASSANT), np.uint64(1) << ep_square, np.uint64(0)
+    )
+    return masks
+
+
+def masks_to_words(masks, white_to_move=True):
+    """ Convert (N, 14) plane masks into (N, 13) codec words, vectorised.
+
+    :param white_to_move: side to move, a bool or a bool array of N values (the planes do not hold it)
+    """
+    masks = np.asarray(masks, dtype=np.uint64).reshape(-1, 14)
+    words = np.empty((len(masks), BOARD_WORDS), dtype=np.uint64)
+    words[:, :12] = masks[:, :12]
+    state = np.where(white_to_move, np.uint64(STATE_WHITE_TO_MOVE), np.uint64(0)).astype(np.uint64)
+    state = np.broadcast_to(state, (len(masks),)).copy()
+    for flag, bit in zip(STATE_CASTLING, _CASTLING_PLANE_BITS):
+        state |= np.where(masks[:, 12] >> np.uint64(bit) & np.uint64(1), np.uint64(flag), np.uint64(0))
+    en_passant = masks[:, 13]
+    # Index of the single set bit (exact in float64 for powers of two)
+    ep_square = np.log2(np.maximum(en_passant, 1).astype(np.float64)).astype(np.uint64) ^ np.uint64(56)
+    state |= np.where(
+        en_passant != 0, np.uint64(STATE_EN_PASSANT) | ep_square << np.uint64(_EP_SHIFT), np.uint64(0)
+    )
+    words[:, 12] = state
+    return words
+
+
+def planes_to_words(planes, white_to_move=True):
+    """ Pack (N, 14, 8, 8) bool planes into (N, 13) uint64 codec words. """
+    planes = np.asarray(planes, dtype=bool).reshape(-1, 14 * 64)
+    masks = np.packbits(planes, axis=-1, bitorder='little').view('<u8')
+    return masks_to_words(masks, white_to_move)
+
+
+def words_to_planes(words, out=None):
+    """ Unpack (N, 13) codec words into (N, 14, 8, 8) bool planes. """
+    return encode_masks(words_to_masks(words).astype('<u8'), out)
+
+
+def words_white_to_move(words):
+    """ Side to move of (N, 13) codec words as a bool array. """
+    return (np.asarray(words, dtype=np.uint64)[..., 12] & np.uint64(STATE_WHITE_TO_MOVE)) != 0
+
+
+def words_clocks(words):
+    """ Halfmove clocks and fullmove numbers of (N, 13) codec words, two int arrays. """
+    state = np.asarray(words, dtype=np.uint64)[..., 12]
+    halfmove = state >> np.uint64(_HALFMOVE_SHIFT) & np.uint64(_HALFMOVE_MAX)
+    fullmove = state >> np.uint64(_FULLMOVE_SHIFT) & np.uint64(_FULLMOVE_MAX)
+    return halfmove.astype(np.int64), fullmove.astype(np.int64)
+
+
+# Constant planes appended to the 14 board planes by every layout version
+LAYOUT_EXTRA_PLANES = {
+    1: (),
+    2: ("white_to_move", "halfmove_clock", "fullmove_number"),
+}
+HALFMOVE_SCALE = 100  # the fifty-move rule draws at 100 plies
+FULLMOVE_SCALE = 200
+
+
+class InputLayout:
+    """ Versioned description of the model input.
+
+    Every board of a stack takes 14 planes plus the extra planes of the version,
+    and the boards [candidate, current, history...] are concatenated along the
+    channels. Version 1 is the original 14-plane bool encoding; version 2 adds
+    a side to move plane and the move clocks scaled to [0, 1].
+    """
+
+    def __init__(self, version=1, stack_size=5):
+        if version not in LAYOUT_EXTRA_PLANES:
+            raise ValueError(f"Unknown input layout version {version}")
+        self.version = version
+        self.stack_size = stack_size
+
+    @classmethod
+    def from_input_shape(cls, input_shape, stack_size=5):
+        """ Layout of a model from its input shape, e.g. model.input_shape[1:] """
+        board_planes = input_shape[-1] // stack_size
+        for version, extra_planes in LAYOUT_EXTRA_PLANES.items():
+            if 14 + len(extra_planes) == board_planes and board_planes * stack_size == input_shape[-1]:
+                return cls(version, stack_size)
+        raise ValueError(f"No input layout with {input_shape[-1]} channels for stacks of {stack_size}")
+
+    @property
+    def extra_planes(self):
+        return LAYOUT_EXTRA_PLANES[self.version]
+
+    @property
+    def board_planes(self):
+        return 14 + len(self.extra_planes)
+
+    @property
+    def input_shape(self):
+        return (8, 8, self.board_planes * self.stack_size)
+
+    @property
+    def dtype(self):
+        """ bool while all planes are 0/1, float32 once clocks are encoded """
+        return np.dtype(bool) if not self.extra_planes else np.dtype(np.float32)
+
+    def __repr__(self):
+        return f"InputLayout(version={self.version}, stack_size={self.stack_size})"
+
+
+def _extra_planes(words):
+    """ Values of the version 2 extra planes, (..., 3) float32 """
+    halfmove, fullmove = words_clocks(words)
+    return np.stack([
+        words_white_to_move(words),
+        np.minimum(halfmove / HALFMOVE_SCALE, 1.0),
+        np.minimum(fullmove / FULLMOVE_SCALE, 1.0),
+    ], axis=-1).astype(np.float32)
+
+
+def encode_word_stacks(stacks, layout=None):
+    """ Encode stacks of codec words (e.g. from LichessAPI.walk_game) into model inputs.
+
+    :param stacks: (N, S, 13) array or list of equally long lists of board_words
+    :param layout: InputLayout, version 1 if None
+    :return: array (N, 8, 8, board planes * S) of layout.dtype, like encode_stacks for version 1
+    """
+    words = np.asarray(stacks, dtype=np.uint64)
+    num_stacks, stack_size = words.shape[:2]
+    planes = words_to_planes(words.reshape(-1, BOARD_WORDS)).reshape(num_stacks, stack_size, 14, 8, 8)
+    planes = planes.transpose(0, 3, 4, 1, 2)  # (N, 8, 8, S, 14)
+    if layout is None or not layout.extra_planes:
+        return planes.reshape(num_stacks, 8, 8, 14 * stack_size)
+
+    # Board and extra planes are written straight into the final buffer; the
+    # extra planes are constant over the board, computed once per position
+    out = np.empty((num_stacks, 8, 8, stack_size, layout.board_planes), dtype=layout.dtype)
+    out[..., :14] = planes
+    out[..., 14:] = _extra_planes(words)[:, np.newaxis, np.newaxis]
+    return out.reshape(num_stacks, 8, 8, layout.board_planes * stack_size)
+
+
+# Plane order after swapping the colours of the pieces
+_COLOR_SWAP = np.r_[6:12, 0:6, 12:14]
+
+
+def flip_colors(inputs, layout=None, out=None):
+    """ Colour-flip model inputs like chess.Board.mirror(), in tensor space.
+
+    Ranks are reversed and white and black pieces swap planes; with version 2
+    the side to move is inverted as well. Castling rights and en passant follow
+    the ranks, so every plane only needs the rank flip.
+
+    :param inputs: array (N, 8, 8, channels) in the given layout (version 1 if None)
+    :param out: optional array of the same shape to write into (not inputs itself)
+    """
+    board_planes = layout.board_planes if layout is not None else 14
+    num_inputs = len(inputs)
+    boards = inputs.reshape(num_inputs, 8, 8, -1, board_planes)[:, ::-1]  # a view
+    if out is None:
+        out = np.empty_like(inputs)
+    flipped = out.reshape(boards.shape)
+    flipped[..., :14] = boards[..., _COLOR_SWAP]
+    if board_planes > 14:
+        flipped[..., 14:] = boards[..., 14:]
+        flipped[..., 14] = 1 - boards[..., 14]  # white_to_move
+    return out
+
+
+def mirror_files(inputs, layout=None, out=None):
+    """ Mirror model inputs left to right (a-file <-> h-file).
+
+    Only a symmetry of positions without castling rights, see castling_free.
+    """
+    if out is None:
+        out = np.empty_like(inputs)
+    out[...] = inputs[:, :, ::-1]
+    return out
+
+
+def castling_free(inputs, layout=None):
+    """ Bool array (N,): no board of the input has castling rights """
+    board_planes = layout.board_planes if layout is not None else 14
+    boards = inputs.reshape(len(inputs), 8, 8, -1, board_planes)
+    return ~boards[..., 12].any(axis=(1, 2, 3))
+
+
+def encode_words(words, layout=None):
+    """ Encode codec words into channel-last boards.
+
+    :param words: (N, 13) uint64 array or list of board_words
+    :param layout: InputLayout, version 1 if None
+    :return: array (N, 8, 8, layout.board_planes) of layout.dtype
+    """
+    words = np.asarray(words, dtype=np.uint64).reshape(-1, 1, BOARD_WORDS)
+    return encode_word_stacks(words, layout)
+
+
 class ChessTensor:
     def __init__(self):
         # 14 layers: 12 for pieces, 1 for castling rights, 1 for en passant
@@ -8,39 +353,15 @@ class ChessTensor:
 
     def piece_index(self, piece):
         """ Returns the index of the piece in the tensor. """
-        piece_order = 'PRNBQKprnbqk'
-        return piece_order.index(piece)
+        return int(PLANE_LOOKUP[ord(piece)])
 
     def parse_fen(self, fen):
         """ Parse a FEN string and update the tensor accordingly. """
-        self.tensor.fill(0)  # Reset tensor
-        board, turn, castling, en_passant, _, _ = fen.split(" ")
+        encode_fens([fen], out=self.tensor[np.newaxis])
 
-        # Fill piece layers
-        rows = board.split("/")
-        for i, row in enumerate(rows):
-            col = 0
-            for char in row:
-                if char.isdigit():
-                    col += int(char)
-                else:
-                    index = self.piece_index(char)
-                    self.tensor[index][7 - i][col] = True
-                    col += 1
-
-        # Fill castling rights layer
-        castling_rights_layer = 12
-        if 'K' in castling: self.tensor[castling_rights_layer][7][7] = True  # White king-side
-        if 'Q' in castling: self.tensor[castling_rights_layer][7][0] = True  # White queen-side
-        if 'k' in castling: self.tensor[castling_rights_layer][0][7] = True  # Black king-side
-        if 'q' in castling: self.tensor[castling_rights_layer][0][0] = True  # Black queen-side
-
-        # Fill en passant layer
-        en_passant_layer = 13
-        if en_passant != "-":
-            file = ord(en_passant[0]) - ord('a')
-            rank = 8 - int(en_passant[1])
-            self.tensor[en_passant_layer][rank][file] = True
+    def parse_board(self, board):
+        """ Update the tensor from a chess.Board (same planes as parse_fen(board.fen())). """
+        encode_boards([board], out=self.tensor[np.newaxis])
 
     def get_tensor(self):
         """ Returns the tensor representation of the board. """
@@ -0,0 +1,70 @@
+"""Minimal UCI engine stand-in for the provider tests.
+
+Answers with the legal moves in UCI order (first = best). Behaviour on "go"
+is picked with the first argument:
+  instant  answer right away (default)
+  think    stream info lines until "stop" or the movetime/wtime budget runs out
+  hang     never answer (a stuck engine)
+  silent   answer right away without info lines (no principal variation)
+"""
+import sys
+import threading
+import time
+
+import chess
+
+MODE = sys.argv[1] if len(sys.argv) > 1 else "instant"
+board = chess.Board()
+multipv = 1
+stop = threading.Event()
+
+
+def send(line):
+    print(line, flush=True)
+
+
+def search(moves, seconds):
+    deadline = time.monotonic() + seconds
+    depth = 1
+    while not stop.wait(0.01) and time.monotonic() < deadline:
+        send(f"info depth {depth} multipv 1 score cp 0 pv {moves[0].uci()}")
+        depth += 1
+    send(f"bestmove {moves[0].uci()}")
+
+
+for line in sys.stdin:
+    parts = line.split()
+    if not parts:
+        continue
+    if parts[0] == "uci":
+        send("id name FakeUCI")
+        send("option name MultiPV type spin default 1 min 1 max 500")
+        send("uciok")
+    elif parts[0] == "isready":
+        send("readyok")
+    elif parts[0] == "setoption" and parts[2] == "MultiPV":
+        multipv = int(parts[4])
+    elif parts[0] == "position":
+        board = chess.Board() if parts[1] == "startpos" else chess.Board(" ".join(parts[2:8]))
+        if "moves" in parts:
+            for move in parts[parts.index("moves") + 1:]:
+                board.push_uci(move)
+    elif parts[0] == "go":
+        moves = sorted(board.legal_moves, key=lambda move: move.uci())[:multipv]
+        if MODE == "hang":
+            continue
+        if MODE == "silent":
+            send(f"bestmove {moves[0].uci()}")
+            continue
+        if MODE == "think":
+            seconds = float(parts[parts.index("movetime") + 1]) / 1000 if "movetime" in parts else 60
+            stop.clear()
+            threading.Thread(target=search, args=(moves, seconds), daemon=True).start()
+            continue
+        for rank, move in enumerate(moves, start=1):
+            send(f"info depth 1 multipv {rank} score cp {-rank} pv {move.uci()}")
+        send(f"bestmove {moves[0].uci()}")
+    elif parts[0] == "stop":
+        stop.set()
+    elif parts[0] == "quit":
+        break
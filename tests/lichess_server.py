@@ -0,0 +1,138 @@
+"""Local stand-in for the Lichess game export endpoint, used by the download tests.
+
+Serves generated games of any username as a chunked PGN stream, newest first,
+and honours the since, until and max parameters of the real API. Can also be
+run on its own (python tests/lichess_server.py) and passed as base_url.
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import chess
+import chess.pgn
+
+FIRST_GAME_TIME = 1_600_000_000_000  # milliseconds, start time of every player's oldest game
+
+
+def make_games(username, count):
+    """Generate count random games of username, oldest first, as (id, start time, PGN text)"""
+    rng = random.Random(username)
+    games = []
+    for number in range(count):
+        board = chess.Board()
+        for _ in range(rng.randint(10, 60)):
+            if board.is_game_over():
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+        game = chess.pgn.Game.from_board(board)
+        identifier = f"{username[:4]}{number:04d}"
+        timestamp = FIRST_GAME_TIME + number * 60_000
+        started = time.gmtime(timestamp // 1000)
+        game.headers["Site"] = f"https://lichess.org/{identifier}"
+        game.headers["White"], game.headers["Black"] = (
+            (username, "opponent") if number % 2 == 0 else ("opponent", username)
+        )
+        game.headers["UTCDate"] = time.strftime("%Y.%m.%d", started)
+        game.headers["UTCTime"] = time.strftime("%H:%M:%S", started)
+        games.append((identifier, timestamp, str(game)))
+    return games
+
+
+class ExportHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        username = url.path.rstrip("/").rsplit("/", 1)[-1]
+        with server.lock:
+            server.requests.append((username, query))
+            rate_limited = server.fail_429 > 0
+            if rate_limited:
+                server.fail_429 -= 1
+            else:
+                server.active += 1
+                server.peak_active = max(server.peak_active, server.active)
+        if rate_limited:
+            self.send_response(429)
+            self.send_header("Retry-After", str(server.retry_after))
+            self.end_headers()
+            return
+        try:
+            self._send_games(username, query)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _send_games(self, username, query):
+        server = self.server
+        since = int(query.get("since", 0))
+        until = int(query.get("until", 1 << 62))
+        selected = [game for game in server.player_games(username) if since <= game[1] <= until]
+        selected = selected[::-1][:int(query.get("max", len(selected)))]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-chess-pgn")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for _, _, pgn_text in selected:
+                data = (pgn_text + "\n\n\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                time.sleep(server.delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading
+
+
+class LichessServer(ThreadingHTTPServer):
+    """
+    Export endpoint on 127.0.0.1 (a free port by default).
+
+    :param games_per_player: number of games every player has
+    :param delay: seconds between two streamed games
+    :param fail_429: number of requests answered with 429 before serving again
+    :param retry_after: Retry-After header of the 429 answers
+    """
+
+    daemon_threads = True
+
+    def __init__(self, games_per_player=120, delay=0.0, fail_429=0, retry_after=0, port=0):
+        super().__init__(("127.0.0.1", port), ExportHandler)
+        self.games_per_player = games_per_player
+        self.delay = delay
+        self.fail_429 = fail_429
+        self.retry_after = retry_after
+        self.games = {}
+        self.requests = []  # (username, query) of every request
+        self.active = 0
+        self.peak_active = 0  # most exports streamed at the same time
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api"
+
+    def player_games(self, username):
+        with self.lock:
+            if username not in self.games:
+                self.games[username] = make_games(username, self.games_per_player)
+            return self.games[username]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    server = LichessServer(port=8000)
+    print(f"Serving games at {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from dataset import ShardDataset, ShardWriter
+
+
+def write_dataset(directory, arrays, shard_size, chunk_size=7):
+    with ShardWriter(directory, shard_size, {"note": "test"}) as writer:
+        for name, array in arrays.items():
+            for start in range(0, len(array), chunk_size):
+                writer.write(name, array[start:start + chunk_size])
+    return ShardDataset(directory)
+
+
+def test_sharded_array_indexes_like_numpy(tmp_path):
+    boards = np.arange(50 * 13, dtype=np.uint64).reshape(50, 13)
+    targets = np.linspace(0, 1, 50, dtype=np.float32)
+    dataset = write_dataset(tmp_path, {"boards": boards, "targets": targets}, shard_size=16)
+    sharded = dataset["boards"]
+
+    assert dataset.metadata == {"note": "test"}
+    assert len(sharded.shards) == 4 and sharded.shape == boards.shape
+    assert np.array_equal(sharded[3], boards[3]) and np.array_equal(sharded[-1], boards[-1])
+    for index in (slice(None), slice(5, 10), slice(10, 40), slice(45, 99), slice(0, 50, 3), slice(30, 20)):
+        assert np.array_equal(sharded[index], boards[index])
+    rows = np.array([[49, 0, 17], [16, 15, -2]])
+    assert np.array_equal(sharded[rows], boards[rows])
+    assert np.array_equal(np.asarray(dataset["targets"]), targets)
+    with pytest.raises(IndexError):
+        sharded[np.array([50])]
+
+
+def test_batches_are_views_of_the_shards(tmp_path):
+    targets = np.arange(40, dtype=np.float32)
+    sharded = write_dataset(tmp_path, {"targets": targets}, shard_size=16)["targets"]
+    batches = list(sharded.batches(10))
+    assert [len(batch) for batch in batches] == [10, 6, 10, 6, 8]
+    assert all(isinstance(batch, np.memmap) for batch in batches)
+    assert np.array_equal(np.concatenate(batches), targets)
+
+
+def test_rows_must_keep_dtype_and_shape(tmp_path):
+    with ShardWriter(tmp_path) as writer:
+        writer.write("boards", np.zeros((2, 13), dtype=np.uint64))
+        with pytest.raises(ValueError):
+            writer.write("boards", np.zeros((2, 12), dtype=np.uint64))
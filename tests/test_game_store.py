@@ -0,0 +1,93 @@
+import time
+
+import game_store
+import pytest
+import requests
+from LichessAPI import RateLimit
+from game_store import GameStore, download_players, game_id
+from lichess_server import FIRST_GAME_TIME, LichessServer, make_games
+
+
+def stored_ids(store, username):
+    return [game_id(game) for game in store.games(username)]
+
+
+def newest_ids(username, first, last):
+    return [f"{username[:4]}{number:04d}" for number in range(last, first - 1, -1)]
+
+
+def test_sync_downloads_only_new_games(tmp_path):
+    with LichessServer(games_per_player=50) as server:
+        store = GameStore(tmp_path, base_url=server.base_url)
+        assert store.sync("alice", 20) == 20
+        assert store.sync("alice", 20) == 0
+        assert server.requests[-1][1]["since"] == str(store.load_index("alice")["last_synced"])
+    assert stored_ids(store, "alice") == newest_ids("alice", 30, 49)
+
+
+def test_backfill_with_since_and_until(tmp_path):
+    with LichessServer(games_per_player=50) as server:
+        store = GameStore(tmp_path, base_url=server.base_url)
+        store.sync("alice", 20)
+        server.games["alice"] = make_games("alice", 55)  # five games played since
+        assert store.sync("alice", 30) == 10
+        _, newer, older = server.requests
+        assert "since" in newer[1] and "until" not in newer[1]
+        assert older[1]["until"] == str(FIRST_GAME_TIME + 30 * 60_000 - 1)  # just before the oldest stored game
+        assert older[1]["max"] == "5"
+    assert stored_ids(store, "alice") == newest_ids("alice", 25, 54)
+
+
+def test_complete_player_is_not_backfilled(tmp_path):
+    with LichessServer(games_per_player=10) as server:
+        store = GameStore(tmp_path, base_url=server.base_url)
+        assert store.sync("alice", 20) == 10
+        assert store.load_index("alice")["complete"]
+        store.sync("alice", 20)
+        assert "until" not in server.requests[-1][1]
+    assert len(stored_ids(store, "alice")) == 10
+
+
+def test_resume_after_interrupted_sync(tmp_path, monkeypatch):
+    stream_games = game_store.stream_games
+
+    def interrupted(*args, **kwargs):
+        for number, game in enumerate(stream_games(*args, **kwargs)):
+            if number == 25:
+                raise requests.ConnectionError("connection dropped")
+            yield game
+
+    with LichessServer(games_per_player=50) as server:
+        store = GameStore(tmp_path, base_url=server.base_url, checkpoint=10)
+        monkeypatch.setattr(game_store, "stream_games", interrupted)
+        with pytest.raises(requests.ConnectionError):
+            store.sync("alice", 40)
+        index = store.load_index("alice")
+        assert len(index["games"]) == 20 and index["last_synced"] is None
+
+        monkeypatch.setattr(game_store, "stream_games", stream_games)
+        assert store.sync("alice", 40) == 20
+    # Games written after the last checkpoint are in games.pgn twice but read once
+    assert stored_ids(store, "alice") == newest_ids("alice", 10, 49)
+
+
+def test_download_players_concurrently(tmp_path):
+    players = ["alice", "bob", "carol", "dave"]
+    with LichessServer(games_per_player=20, delay=0.01) as server:
+        store = GameStore(tmp_path, base_url=server.base_url)
+        results = download_players(players, 20, store, workers=4)
+        assert server.peak_active > 1
+    assert {player: new_games for player, (new_games, _) in results.items()} == dict.fromkeys(players, 20)
+    for player in players:
+        assert stored_ids(store, player) == newest_ids(player, 0, 19)
+
+
+def test_download_players_backs_off_on_429(tmp_path):
+    players = ["alice", "bob", "carol"]
+    with LichessServer(games_per_player=10, fail_429=2, retry_after=0.3) as server:
+        store = GameStore(tmp_path, base_url=server.base_url, rate_limit=RateLimit(0.01))
+        start = time.monotonic()
+        results = download_players(players, 10, store, workers=3)
+        assert time.monotonic() - start >= 0.3  # Retry-After was honoured
+        assert len(server.requests) == len(players) + 2
+    assert all(new_games == 10 for new_games, _ in results.values())
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+import requests
+from LichessAPI import RateLimit, prefetch, stream_games
+from game_store import game_id
+from lichess_server import LichessServer
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_stream_games_newest_first():
+    with LichessServer(games_per_player=30) as server:
+        games = list(stream_games("alice", 10, base_url=server.base_url))
+    assert [game_id(game) for game in games] == [f"alic{number:04d}" for number in range(29, 19, -1)]
+    assert server.requests[0][1]["max"] == "10"
+
+
+def test_stream_games_retries_after_429():
+    with LichessServer(games_per_player=5, fail_429=2) as server:
+        games = list(stream_games("alice", 5, base_url=server.base_url, rate_limit=RateLimit(0.01)))
+    assert len(games) == 5
+    assert len(server.requests) == 3
+
+
+def test_stream_games_gives_up_after_max_retries():
+    with LichessServer(fail_429=5) as server:
+        with pytest.raises(requests.HTTPError):
+            list(stream_games("alice", 5, base_url=server.base_url, max_retries=1))
+    assert len(server.requests) == 2
+
+
+def test_prefetch_keeps_order():
+    assert list(prefetch(iter(range(100)), buffer_size=4)) == list(range(100))
+
+
+def test_prefetch_raises_producer_error():
+    def source():
+        yield 1
+        raise ValueError("broken export")
+
+    items = prefetch(source())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="broken export"):
+        next(items)
+
+
+def test_prefetch_stops_producer_when_consumer_stops():
+    closed = threading.Event()
+
+    def source(count):
+        try:
+            yield from range(count)
+        finally:
+            closed.set()
+
+    threads = threading.active_count()
+    # The producer is blocked on a full queue, then on its final marker
+    for count in (100, 2):
+        closed.clear()
+        items = prefetch(source(count), buffer_size=1)
+        assert next(items) == 0
+        time.sleep(0.2)
+        items.close()
+        assert closed.wait(2.0)
+        assert wait_for(lambda: threading.active_count() == threads)
+
+
+def test_prefetch_closes_download_when_consumer_stops():
+    with LichessServer(games_per_player=50, delay=0.01) as server:
+        items = prefetch(stream_games("alice", 50, base_url=server.base_url), buffer_size=2)
+        assert next(items) is not None
+        items.close()
+        assert wait_for(lambda: server.active == 0)
@@ -0,0 +1,12 @@
+import chess
+import pytest
+from app import Chess
+from bitboard import BitboardChess
+from perft import POSITIONS, reference_perft, run_position
+
+
+@pytest.mark.parametrize("engine_cls", [Chess, BitboardChess])
+@pytest.mark.parametrize("name, fen, depth", POSITIONS, ids=[name for name, _, _ in POSITIONS])
+def test_perft_matches_python_chess(engine_cls, name, fen, depth):
+    nodes, _ = run_position(engine_cls, fen, depth)
+    assert nodes == reference_perft(chess.Board(fen), depth)
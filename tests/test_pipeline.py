@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from lichess_server import make_games
+from pipeline import build_examples, build_position_table, encode_game, game_seed, iter_examples
+from tensor import InputLayout
+
+
+def training_games(count=6):
+    return [
+        (pgn_text, "white" if number % 2 == 0 else "black")
+        for number, (_, _, pgn_text) in enumerate(make_games("alice", count))
+    ]
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_examples_match_the_position_table(version):
+    layout = InputLayout(version, stack_size=5)
+    inputs, targets = build_examples(training_games(), processes=1, seed=3, layout=layout)
+    table = build_position_table(training_games(), processes=1, seed=3)
+    assert inputs.shape[1:] == layout.input_shape and inputs.dtype == layout.dtype
+    assert np.array_equal(inputs, table.assemble(table.examples, layout))
+    assert np.array_equal(targets, table.targets)
+
+
+def test_examples_without_games_have_the_layout_shape():
+    inputs, targets = build_examples([], layout=InputLayout(2, stack_size=5))
+    assert inputs.shape == (0, 8, 8, 85) and inputs.dtype == np.float32 and targets.shape == (0,)
+
+
+def test_layout_must_fit_the_history():
+    with pytest.raises(ValueError):
+        build_examples(training_games(1), previous_moves=2, layout=InputLayout(2, stack_size=5))
+
+
+def test_chunks_follow_game_order_on_any_number_of_processes():
+    games = training_games(7)
+    chunks = list(iter_examples(games, processes=2, shard_size=3, seed=5))
+    assert len(chunks) == 3  # shards of 3, 3 and 1 games
+    expected = [encode_game(pgn_text, color, seed=game_seed(5, index)) for index, (pgn_text, color) in enumerate(games)]
+    assert np.array_equal(np.concatenate([inputs for inputs, _ in chunks]), np.concatenate([inputs for inputs, _ in expected]))
+
+    inputs, targets = build_examples(games, processes=1, shard_size=2, seed=5)
+    assert np.array_equal(inputs, np.concatenate([inputs for inputs, _ in chunks]))
+    assert np.array_equal(targets, np.concatenate([targets for _, targets in chunks]))
+
+
+def test_negative_sampling_follows_the_seed():
+    games = training_games(4)
+    first = build_examples(games, processes=1, seed=1)[0]
+    assert np.array_equal(first, build_examples(games, processes=2, seed=1)[0])
+    assert not np.array_equal(first, build_examples(games, processes=1, seed=2)[0])
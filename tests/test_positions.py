@@ -0,0 +1,34 @@
+import numpy as np
+from lichess_server import make_games
+from positions import PositionTable, index_game
+
+
+def make_table(num_games=6, previous_moves=3):
+    table = PositionTable(previous_moves + 2)
+    for number, (_, _, pgn_text) in enumerate(make_games("alice", num_games)):
+        table.add_game(*index_game(pgn_text, "white" if number % 2 == 0 else "black", previous_moves, number))
+    return table
+
+
+def test_positions_are_stored_once():
+    table = make_table()
+    boards = table.boards[:len(table)]
+    assert len(table) == len(table.ids)
+    assert len(np.unique(boards, axis=0)) == len(boards)
+    assert table.examples.max() == len(table) - 1
+
+
+def test_saved_table_loads_with_its_boards(tmp_path):
+    table = make_table()
+    table.save(tmp_path / "table", shard_size=64)
+    loaded = PositionTable.load(tmp_path / "table")
+    assert len(loaded) == len(table)
+    assert len(loaded.boards.shards) > 1
+    assert np.array_equal(loaded.examples, table.examples)
+    assert np.array_equal(loaded.targets, table.targets)
+    batch = np.arange(0, len(table.targets), 7)
+    assert np.array_equal(loaded.assemble(loaded.examples[batch]), table.assemble(table.examples[batch]))
+
+    # Saving a loaded table writes the same boards again
+    loaded.save(tmp_path / "copy")
+    assert len(PositionTable.load(tmp_path / "copy")) == len(table)
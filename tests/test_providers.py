@@ -0,0 +1,175 @@
+import os
+import sys
+import threading
+import time
+
+import chess
+import numpy as np
+import pytest
+from providers import BlendProvider, EngineProvider, SearchProvider, UCIEnginePool
+
+FAKE_UCI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_uci.py")
+
+
+def make_pool(mode="instant", **kwargs):
+    return UCIEnginePool([sys.executable, FAKE_UCI, mode], **kwargs)
+
+
+def first_moves(board, count):
+    # The fake engine ranks the legal moves in UCI order
+    return sorted(board.legal_moves, key=lambda move: move.uci())[:count]
+
+
+def test_engine_provider_plays_best_move():
+    pool = make_pool()
+    try:
+        board = chess.Board()
+        assert EngineProvider(pool).choose_move(board, []) == first_moves(board, 1)[0]
+    finally:
+        pool.close()
+    assert pool.started == 0
+
+
+def test_best_moves_multipv():
+    pool = make_pool()
+    try:
+        board = chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        assert pool.best_moves(board, 4) == first_moves(board, 4)
+    finally:
+        pool.close()
+
+
+def test_blend_provider_lets_the_model_pick():
+    pool = make_pool()
+    try:
+        board = chess.Board()
+        assert BlendProvider(LastMoveModel(), pool, candidates=3).choose_move(board, []) == first_moves(board, 3)[-1]
+    finally:
+        pool.close()
+
+
+class LastMoveModel:
+    def score_moves(self, board, history_planes, moves):
+        return np.arange(len(moves), dtype=np.float32)
+
+
+def test_blend_provider_without_engine_line_asks_the_model():
+    pool = make_pool("silent")
+    try:
+        board = chess.Board()
+        assert BlendProvider(LastMoveModel(), pool).choose_move(board, []) == list(board.legal_moves)[-1]
+    finally:
+        pool.close()
+
+
+def test_pool_never_starts_more_than_size_engines():
+    pool = make_pool(size=2)
+    started = []
+    original_acquire = pool._acquire
+
+    def acquire():
+        engine = original_acquire()
+        started.append(pool.started)
+        return engine
+
+    pool._acquire = acquire
+    try:
+        threads = [threading.Thread(target=pool.best_moves, args=(chess.Board(),)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(started) <= 2
+        assert len(pool.idle) == pool.started <= 2
+    finally:
+        pool.close()
+
+
+def test_stuck_engine_is_dropped_after_timeout():
+    pool = make_pool("hang", time_limit=0.1, timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            pool.best_moves(chess.Board())
+        assert pool.started == 0 and not pool.idle
+        time.sleep(0.2)
+        assert not [thread for thread in threading.enumerate() if thread.name.startswith("SimpleEngine")]
+        # The next call starts a fresh process instead of waiting for the stuck one
+        pool.command = [sys.executable, FAKE_UCI, "instant"]
+        assert pool.best_moves(chess.Board()) == first_moves(chess.Board(), 1)
+    finally:
+        pool.close()
+
+
+def run_callers(pool, count):
+    # Calls best_moves from count threads at once, returns what every call raised (None if nothing)
+    errors = [None] * count
+
+    def call(number):
+        try:
+            pool.best_moves(chess.Board())
+        except Exception as error:
+            errors[number] = error
+
+    threads = [threading.Thread(target=call, args=(number,), daemon=True) for number in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)  # the first caller takes the only engine
+    return threads, errors
+
+
+def test_waiting_caller_is_woken_when_busy_engine_fails():
+    pool = make_pool("hang", size=1, time_limit=0.1, timeout=0.2)
+    try:
+        threads, errors = run_callers(pool, 2)
+        for thread in threads:
+            thread.join(5.0)
+        assert not any(thread.is_alive() for thread in threads)
+        # The waiting caller started an engine of its own, which got stuck as well
+        assert [type(error) for error in errors] == [TimeoutError, TimeoutError]
+        assert pool.started == 0
+    finally:
+        pool.close()
+
+
+def test_close_wakes_waiting_callers():
+    pool = make_pool("think", size=1, time_limit=0.5)
+    threads, errors = run_callers(pool, 2)
+    pool.close()
+    threads[1].join(1.0)
+    assert not threads[1].is_alive()
+    assert isinstance(errors[1], RuntimeError)
+    threads[0].join(5.0)
+    assert errors[0] is None
+    assert pool.started == 0 and not pool.idle
+
+
+def test_cancel_stops_engine_search():
+    pool = make_pool("think", time_limit=5.0)
+    cancel = threading.Event()
+    try:
+        threading.Timer(0.1, cancel.set).start()
+        start = time.perf_counter()
+        EngineProvider(pool).choose_move(chess.Board(), [], cancel)
+        assert time.perf_counter() - start < 2.0
+        assert len(pool.idle) == 1  # the stopped engine is reused
+    finally:
+        pool.close()
+
+
+def test_close_stops_engines_busy_during_close():
+    pool = make_pool("think", time_limit=0.3)
+    thread = threading.Thread(target=pool.best_moves, args=(chess.Board(),))
+    thread.start()
+    time.sleep(0.1)
+    pool.close()
+    thread.join()
+    assert pool.started == 0 and not pool.idle
+
+
+def test_cancel_stops_native_search():
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.perf_counter()
+    move = SearchProvider(time_limit=5.0).choose_move(chess.Board(), [], cancel)
+    assert time.perf_counter() - start < 2.0
+    assert move in chess.Board().legal_moves
@@ -0,0 +1,106 @@
+import random
+
+import chess
+import numpy as np
+import pytest
+from tensor import (
+    InputLayout, board_words, castling_free, encode_boards, encode_fens, encode_word_stacks,
+    encode_words, flip_colors, masks_to_words, mirror_files, planes_to_words, words_clocks,
+    words_to_masks, words_to_planes, words_white_to_move,
+)
+
+# Bits of the state word the 14 planes do not hold (halfmove clock and fullmove number)
+CLOCK_BITS = np.uint64(((1 << 40) - 1) ^ ((1 << 16) - 1))
+
+SPECIAL_FENS = [
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",  # en passant
+    "rnbqkbnr/pppp1ppp/8/8/3Pp3/8/PPP1PPPP/RNBQKBNR b Kq d3 0 3",  # en passant, partial rights
+    "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1",  # pinned en passant pawn, not encoded
+    "r3k2r/8/8/8/8/8/8/R3K2R w - - 99 150",
+    "4k3/8/8/8/8/8/8/4K3 b - - 300 70000",  # clocks above their field width
+]
+
+
+def random_boards(count=60, seed=0):
+    """Boards from random games, plus positions with en passant and large clocks"""
+    rng = random.Random(seed)
+    boards = [chess.Board(fen) for fen in SPECIAL_FENS]
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(0, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+def test_words_decode_to_the_fen_planes():
+    boards = random_boards()
+    words = np.array([board_words(board) for board in boards], dtype=np.uint64)
+    assert np.array_equal(words_to_planes(words), encode_fens(board.fen() for board in boards))
+
+
+def test_boards_encode_like_their_fens():
+    boards = random_boards()
+    assert np.array_equal(encode_boards(boards), encode_fens(board.fen() for board in boards))
+
+
+def test_words_round_trip_through_planes_and_masks():
+    words = np.array([board_words(board) for board in random_boards()], dtype=np.uint64)
+    white_to_move = words_white_to_move(words)
+    board_state = words.copy()
+    board_state[:, 12] &= ~CLOCK_BITS
+    assert np.array_equal(masks_to_words(words_to_masks(words), white_to_move), board_state)
+    assert np.array_equal(planes_to_words(words_to_planes(words), white_to_move), board_state)
+
+
+def test_state_word_keeps_side_to_move_and_clocks():
+    boards = random_boards()
+    words = np.array([board_words(board) for board in boards], dtype=np.uint64)
+    halfmove, fullmove = words_clocks(words)
+    assert words_white_to_move(words).tolist() == [board.turn for board in boards]
+    assert halfmove.tolist() == [min(board.halfmove_clock, 255) for board in boards]
+    assert fullmove.tolist() == [min(board.fullmove_number, 65535) for board in boards]
+
+
+@pytest.mark.parametrize("fen", SPECIAL_FENS)
+def test_clocks_do_not_touch_the_board_bits(fen):
+    board = chess.Board(fen)
+    words = np.array([board_words(board)], dtype=np.uint64)
+    board.halfmove_clock, board.fullmove_number = 0, 1
+    without_clocks = np.array([board_words(board)], dtype=np.uint64)
+    assert np.array_equal(words_to_planes(words), words_to_planes(without_clocks))
+    assert np.array_equal(words[:, 12] & ~CLOCK_BITS, without_clocks[:, 12] & ~CLOCK_BITS)
+
+
+def encode(boards, layout):
+    return encode_words([board_words(board) for board in boards], layout)
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_flip_colors_matches_mirrored_boards(version):
+    layout = InputLayout(version, stack_size=1)
+    boards = random_boards()
+    flipped = flip_colors(encode(boards, layout), layout)
+    assert np.array_equal(flipped, encode([board.mirror() for board in boards], layout))
+    assert np.array_equal(flip_colors(flipped, layout), encode(boards, layout))
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_mirror_files_matches_flipped_boards_without_castling(version):
+    layout = InputLayout(version, stack_size=1)
+    boards = random_boards()
+    for board in boards:
+        board.castling_rights = chess.BB_EMPTY
+    mirrored = [board.transform(chess.flip_horizontal) for board in boards]
+    assert np.array_equal(mirror_files(encode(boards, layout), layout), encode(mirrored, layout))
+
+
+def test_castling_free_looks_at_every_board_of_a_stack():
+    layout = InputLayout(2, stack_size=2)
+    free, castling = chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1"), chess.Board()
+    stacks = [[free, free], [free, castling], [castling, free]]
+    inputs = encode_word_stacks([[board_words(board) for board in stack] for stack in stacks], layout)
+    assert castling_free(inputs, layout).tolist() == [True, False, False]
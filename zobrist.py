@@ -0,0 +1,100 @@
+import random
+
+
+# Fixed seed, so hashes are the same in every process and run
+_rng = random.Random(0x5EED)
+
+# Keys indexed as ZOBRIST_PIECES[fig][row * 8 + col]
+ZOBRIST_PIECES = {
+    fig: [_rng.getrandbits(64) for _ in range(64)] for fig in "pnbrqkPNBRQK"
+}
+# (queen_side, king_side) keys of white and black castling rights
+ZOBRIST_WHITE_CASTLE = [_rng.getrandbits(64), _rng.getrandbits(64)]
+ZOBRIST_BLACK_CASTLE = [_rng.getrandbits(64), _rng.getrandbits(64)]
+# En passant target, keyed by column
+ZOBRIST_EN_PASSANT = [_rng.getrandbits(64) for _ in range(8)]
+ZOBRIST_WHITE_TURN = _rng.getrandbits(64)
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+
+class TranspositionTable:
+    """Fixed-size table of positions keyed by Zobrist hash
+
+    Every slot holds one entry [key, generation, depth, score, flag,
+    best_move, moves]. A slot used by another position is overwritten only
+    if its entry comes from an older search (see new_search) or was searched
+    to the same or a lower depth. Cached move lists count as depth -1, so
+    they never push out search results of the current search.
+    """
+
+    def __init__(self, size=1 << 16) -> None:
+        """
+        :param size: number of slots, rounded up to a power of two
+        :type size: int
+        """
+        self.size = 1 << max(size - 1, 1).bit_length()
+        self.mask = self.size - 1
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+    def new_search(self):
+        """Mark all current entries as replaceable"""
+        self.generation += 1
+
+    def probe(self, key):
+        """Get the entry of a position
+
+        :param key: Zobrist hash of the position
+        :type key: int
+        :return: [key, generation, depth, score, flag, best_move, moves] or None
+        :rtype: list
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def _entry_for(self, key, depth):
+        """Get the entry to write for key, or None if the slot is kept"""
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        if entry is None or entry[1] != self.generation or depth >= entry[2]:
+            entry = [key, self.generation, -1, None, None, None, None]
+            self.entries[index] = entry
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, best_move):
+        """Store a search result
+
+        :param key: Zobrist hash of the position
+        :type key: int
+        :param depth: remaining search depth of the result
+        :type depth: int
+        :param score: score from the side to move's point of view
+        :type score: int
+        :param flag: EXACT, LOWER_BOUND or UPPER_BOUND
+        :type flag: int
+        :param best_move: best (or refuting) move found
+        :type best_move: tuple
+        """
+        entry = self._entry_for(key, depth)
+        if entry is not None and (depth >= entry[2] or entry[1] != self.generation):
+            entry[1:6] = [self.generation, depth, score, flag, best_move]
+
+    def probe_moves(self, key):
+        """Get the cached legal moves of a position or None"""
+        entry = self.probe(key)
+        return entry[6] if entry is not None else None
+
+    def store_moves(self, key, moves):
+        """Cache the legal moves of a position"""
+        entry = self._entry_for(key, -1)
+        if entry is not None:
+            entry[6] = moves